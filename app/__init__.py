@@ -17,9 +17,47 @@ def create_app(test_config=None):
     for folder in [app.config['UPLOAD_FOLDER'], 
                    app.config['HANDWRITTEN_FOLDER'], 
                    app.config['CONTEXT_FOLDER'], 
-                   app.config['SUBMISSIONS_FOLDER']]:
+                   app.config['SUBMISSIONS_FOLDER'],
+                   app.config['EXTRACTION_CACHE_FOLDER']]:
         os.makedirs(folder, exist_ok=True)
     
+    # Process-wide metrics registry scraped from /metrics
+    from app.utils.metrics import MetricsRegistry
+    app.extensions['metrics'] = MetricsRegistry(app.config['METRICS_NAMESPACE'])
+
+    # Worker pool for background processing jobs, the per-process cap on
+    # concurrent runs, the OCR process pool and the rate limiter shared by
+    # every grading thread.
+    # Server workers rebuild these after fork (see app.utils.warmup).
+    from app.utils.warmup import reinit_after_fork
+    reinit_after_fork(app)
+
+    # Grading cache, persistent by default so repeat runs survive restarts
+    from app.utils.cache import create_cache
+    app.extensions['grading_cache'] = create_cache(
+        app.config['GRADING_CACHE_BACKEND'],
+        path=app.config['GRADING_CACHE_PATH'],
+        max_entries=app.config['GRADING_CACHE_MAX_ENTRIES'],
+        ttl=app.config['GRADING_CACHE_TTL']
+    )
+
+    # Archive of signatures from earlier runs for cross-term plagiarism checks
+    if app.config['CORPUS_ENABLED']:
+        from app.utils.corpus import SignatureCorpus
+        app.extensions['signature_corpus'] = SignatureCorpus(
+            app.config['CORPUS_FOLDER'],
+            num_perm=app.config['MINHASH_NUM_PERM'],
+            bands=app.config['LSH_BANDS'],
+            rows=app.config['LSH_ROWS'],
+            tail_limit=app.config['CORPUS_TAIL_LIMIT'],
+            max_dead_fraction=app.config['CORPUS_MAX_DEAD_FRACTION']
+        )
+
+    # Per-course state of the last run, for delta re-grading
+    if app.config['COURSE_STATE_ENABLED']:
+        from app.utils.course_state import CourseStateStore
+        app.extensions['course_state'] = CourseStateStore(app.config['COURSE_STATE_FOLDER'])
+
     # Import and register routes
     from app.routes import main_bp
     app.register_blueprint(main_bp)
@@ -5,21 +5,101 @@ load_dotenv()
 
 class Config:
     # Base folders
-    UPLOAD_BASE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
+    UPLOAD_BASE = os.getenv('UPLOAD_BASE', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads'))
     
     # Upload folders
     UPLOAD_FOLDER = os.path.join(UPLOAD_BASE, 'UPLOAD_FOLDER')
     HANDWRITTEN_FOLDER = os.path.join(UPLOAD_BASE, 'HANDWRITTEN_FOLDER')
     CONTEXT_FOLDER = os.path.join(UPLOAD_BASE, 'CONTEXT_FOLDER')
     SUBMISSIONS_FOLDER = os.path.join(UPLOAD_BASE, 'submissions')
+    EXTRACTION_CACHE_FOLDER = os.path.join(UPLOAD_BASE, 'cache', 'extraction')
+    CORPUS_FOLDER = os.path.join(UPLOAD_BASE, 'corpus')
+    TEXT_STORE_FOLDER = os.path.join(UPLOAD_BASE, 'cache', 'texts')  # Per-job extracted texts, removed after each run
+    COURSE_STATE_FOLDER = os.path.join(UPLOAD_BASE, 'course_state')  # Last run of each course assignment
     
     # File upload settings
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     ALLOWED_EXTENSIONS = {'pdf'}
     
+    # OCR settings
+    OCR_DPI = 200
+    OCR_WORKERS = int(os.getenv('OCR_WORKERS', os.cpu_count() or 1))  # Per host; split across server workers
+    OCR_PAGES_PER_TASK = 4  # Pages rasterized together; bounds peak memory per worker
+    NATIVE_TEXT_MIN_CHARS = 50  # Min text-layer chars for a page to skip OCR (None = always OCR)
+    NATIVE_TEXT_MAX_IMAGE_COVERAGE = 0.5  # Pages this much covered by images are OCR'd anyway (None = off)
+    # 'fixed' renders every OCR'd page in colour at OCR_DPI; 'adaptive' probes each page at
+    # OCR_PROBE_DPI to skip blank pages, crop margins and pick a DPI, then binarizes it
+    OCR_MODE = os.getenv('OCR_MODE', 'fixed')
+    OCR_PROBE_DPI = 72
+    OCR_MIN_DPI = 150
+    OCR_MAX_DPI = 300
+    OCR_MIN_CONFIDENCE = 60  # Adaptive pages below this mean word confidence are re-OCR'd at higher DPI
+    OCR_BLANK_INK_RATIO = 0.002  # Adaptive pages with less ink than this are skipped as blank
+
+    # Extraction cache (entries keyed by SHA-256 of the PDF, LRU-evicted by size)
+    EXTRACTION_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+    # Shingling and MinHash settings
+    SHINGLE_SIZE = 5
+    MINHASH_NUM_PERM = 128
+
+    # Google Drive download settings
+    DRIVE_API_BASE = os.getenv('DRIVE_API_BASE', 'https://www.googleapis.com/drive/v3')
+    DOWNLOAD_WORKERS = 8  # Concurrent downloads through one pooled session
+    DOWNLOAD_RETRIES = 3  # Retries on 429/5xx with exponential backoff
+    DOWNLOAD_BACKOFF_FACTOR = 0.5
+    DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+    # Download -> OCR -> signing pipeline (worker threads per stage, queue bound between stages)
+    EXTRACT_WORKERS = 1  # Each extraction already fans pages out over OCR_WORKERS processes
+    SIGN_WORKERS = 2
+    PIPELINE_QUEUE_SIZE = 4
+
+    # Background jobs (/jobs endpoints)
+    JOB_WORKERS = 2  # Jobs processed concurrently per app process
+    JOB_RETENTION_SECONDS = 3600  # How long finished job results are kept
+    JOB_STATE_FOLDER = os.path.join(UPLOAD_BASE, 'jobs')  # Job state shared by all server workers on the host
+    MAX_HEAVY_JOBS_PER_WORKER = int(os.getenv('MAX_HEAVY_JOBS_PER_WORKER', 1))  # Concurrent runs per process
+    HEAVY_JOB_WAIT_SECONDS = 30  # How long /process_assignments waits for a slot before answering 503
+
     # API settings
     API_KEY = os.getenv('GEMINI_API_KEY')
+    GEMINI_API_BASE = os.getenv('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com/v1beta')
+    GEMINI_MODEL = 'gemini-2.0-flash'
+    GEMINI_REQUESTS_PER_MINUTE = int(os.getenv('GEMINI_REQUESTS_PER_MINUTE', 15))  # Match the API quota for the key in use
+    GRADING_MAX_IN_FLIGHT = 4  # Concurrent Gemini requests per processing run
+    GRADING_MAX_RETRIES = 5  # Retries on 429/5xx and timeouts with jittered exponential backoff
+    GEMINI_CONNECT_TIMEOUT_SECONDS = 10
+    GEMINI_TIMEOUT_SECONDS = 120  # Longest wait for a response (between bytes); then the request is retried
+    # Batch grading packs several groups into one prompt that asks for JSON grades,
+    # sending the rubric once per batch; unparsed submissions fall back to single calls
+    GRADING_BATCH_ENABLED = os.getenv('GRADING_BATCH_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    GRADING_BATCH_TOKEN_BUDGET = 24000  # Estimated prompt tokens per batch, rubric included
+    GRADING_BATCH_MAX_SUBMISSIONS = 8  # Keeps per-batch output within the model's response limit
+
+    # Grading cache: 'sqlite' (persistent, shared by workers on one host) or 'memory' (per process LRU)
+    GRADING_CACHE_BACKEND = os.getenv('GRADING_CACHE_BACKEND', 'sqlite')
+    GRADING_CACHE_PATH = os.path.join(UPLOAD_BASE, 'cache', 'grading.sqlite3')
+    GRADING_CACHE_MAX_ENTRIES = 100000
+    GRADING_CACHE_TTL = 30 * 24 * 3600  # Seconds; None keeps entries until evicted
     
     # Plagiarism thresholds
     PLAGIARISM_THRESHOLD = 30  # Percentage
-    GROUP_SIMILARITY_THRESHOLD = 0.8  # Cosine similarity
\ No newline at end of file
+    GROUP_SIMILARITY_THRESHOLD = 0.8  # Cosine similarity
+
+    # LSH banding for plagiarism candidate search (LSH_BANDS * LSH_ROWS <= num_perm)
+    LSH_BANDS = 64
+    LSH_ROWS = 2
+
+    # Cross-term plagiarism corpus (persistent, memory-mapped signature archive)
+    CORPUS_ENABLED = True
+    CORPUS_TAIL_LIMIT = 4096  # Unindexed rows scanned directly before the band index is rebuilt
+    CORPUS_MAX_DEAD_FRACTION = 0.25  # Replaced/deleted row share above which a rebuild compacts the archive
+
+    # Delta re-grading: keep each course assignment's file ids, update times, hashes, signatures,
+    # scores and grades, and only fetch, OCR and grade new or changed submissions on the next run
+    COURSE_STATE_ENABLED = os.getenv('COURSE_STATE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+    # Instrumentation: /metrics endpoint and the optional `timings` response block
+    METRICS_NAMESPACE = 'grader'  # Prefix for exported metric names
+    RESPONSE_TIMINGS = False  # Always include `timings`; otherwise only with ?timings=1
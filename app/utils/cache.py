@@ -0,0 +1,160 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryLRUCache:
+    """
+    In-process LRU cache with an optional time-to-live.
+
+    Holds at most `max_entries` values; entries older than `ttl` seconds are
+    treated as misses. Counts hits, misses and evictions.
+    """
+
+    def __init__(self, max_entries=1024, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self.ttl is not None and time.time() - item[1] > self.ttl:
+                del self._data[key]
+                self.evictions += 1
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'entries': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+class SQLiteCache:
+    """
+    Persistent cache stored in a SQLite file.
+
+    Survives restarts and can be shared by several worker processes on the same
+    host. Values must be JSON-serialisable. Entries older than `ttl` seconds are
+    dropped on read, and the least recently used rows are evicted once the
+    table holds more than `max_entries`.
+    """
+
+    def __init__(self, path, max_entries=100000, ttl=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+
+    def _connect(self):
+        # sqlite3 connections cannot be shared between threads or forked
+        # processes, so keep one per thread and drop inherited ones after fork
+        if self._pid != os.getpid():
+            self._local = threading.local()
+            self._pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, field, amount=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    def get(self, key):
+        conn = self._connect()
+        row = conn.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is not None and self.ttl is not None and time.time() - row[1] > self.ttl:
+            with conn:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._count('evictions')
+            row = None
+        if row is None:
+            self._count('misses')
+            return None
+        with conn:
+            conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (time.time(), key))
+        self._count('hits')
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now)
+            )
+            (count,) = conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+            excess = count - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                    (excess,)
+                )
+                self._count('evictions', excess)
+
+    def stats(self):
+        (entries,) = self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()
+        with self._lock:
+            return {
+                'backend': 'sqlite',
+                'entries': entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+def create_cache(backend, path=None, max_entries=1024, ttl=None):
+    """
+    Build a cache backend by name ('memory' or 'sqlite')
+    """
+    if backend == 'memory':
+        return MemoryLRUCache(max_entries=max_entries, ttl=ttl)
+    if backend == 'sqlite':
+        return SQLiteCache(path, max_entries=max_entries, ttl=ttl)
+    raise ValueError(f"Unknown cache backend: {backend}")
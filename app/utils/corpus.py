@@ -0,0 +1,458 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from app.utils.lsh import get_hashvalues
+from app.utils.text_analysis import SHINGLE_HASH_VERSION
+
+_FNV_OFFSET = np.uint64(0xcbf29ce484222325)
+_FNV_PRIME = np.uint64(0x100000001b3)
+
+
+def band_hashes(signatures, bands, rows):
+    """
+    Collapse each LSH band of a `(n, num_perm)` signature matrix into one uint64.
+    Returns an `(n, bands)` matrix; equal bands always produce equal hashes.
+    """
+    signatures = np.asarray(signatures, dtype=np.uint64)
+    banded = signatures[:, :bands * rows].reshape(len(signatures), bands, rows)
+    hashes = np.full((len(signatures), bands), _FNV_OFFSET, dtype=np.uint64)
+    for r in range(rows):
+        hashes ^= banded[:, :, r]
+        hashes *= _FNV_PRIME
+    return hashes
+
+
+def _lock_file(lock_file):
+    """
+    Take an exclusive lock on an open file, shared with other processes
+    """
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return
+    # msvcrt gives up after about ten seconds; keep waiting like flock does
+    lock_file.seek(0)
+    while True:
+        try:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            continue
+
+
+def _unlock_file(lock_file):
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+    else:
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class SignatureCorpus:
+    """
+    Persistent, memory-mapped archive of MinHash signatures with an LSH index.
+
+    Layout of `folder` (files of generation g > 0 carry a `.g` suffix, e.g.
+    signatures.3.bin; meta.json names the current generation):
+        signatures.bin   raw (n, num_perm) uint64 rows, append-only
+        bandhash.bin     raw (n, bands) uint64 band hashes, append-only
+        keys.log         JSON lines recording which key (and owner: submission
+                         and assignment ids) each row belongs to, and deletions
+        index_*.npy      per-band sorted band hashes and row ids for the first
+                         `indexed_rows` rows (see meta.json)
+
+    Rows appended after the last index build form a small tail that is scanned
+    directly; the index is rebuilt once the tail exceeds `tail_limit`. Queries
+    binary-search the memory-mapped index, so workers share the data through the
+    page cache instead of loading it. Deleted and replaced keys are tombstoned
+    in the log; re-inserting a key with the same signature and owner writes
+    nothing. When more than `max_dead_fraction` of the rows are dead at an index
+    rebuild, the live rows are copied into a new generation and the old files
+    removed. Writers serialise on an flock (and a thread lock within one
+    process), and readers pick up rows, index rebuilds and new generations
+    written by other processes on `refresh()`.
+
+    meta.json records the shingle hashing version; an archive written under
+    another version is moved aside to `stale-v<version>-<time>/` and a new one
+    started, since its signatures cannot be compared with new ones.
+    """
+
+    def __init__(self, folder, num_perm=128, bands=64, rows=2, tail_limit=4096,
+                 hash_version=SHINGLE_HASH_VERSION, max_dead_fraction=0.25):
+        if bands * rows > num_perm:
+            raise ValueError("bands * rows must not exceed num_perm")
+        self.folder = folder
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = rows
+        self.tail_limit = tail_limit
+        self.hash_version = hash_version
+        self.max_dead_fraction = max_dead_fraction
+        os.makedirs(folder, exist_ok=True)
+        self._thread_lock = threading.RLock()
+        self._meta_path = os.path.join(folder, 'meta.json')
+        self._generation = None
+
+        with self._write_lock():
+            self._check_meta()
+            open(self._log_path, 'ab').close()
+        self.refresh()
+
+    def _paths(self, generation):
+        suffix = f'.{generation}' if generation else ''
+        return {
+            'signatures': os.path.join(self.folder, f'signatures{suffix}.bin'),
+            'bandhash': os.path.join(self.folder, f'bandhash{suffix}.bin'),
+            'log': os.path.join(self.folder, f'keys{suffix}.log'),
+            'index_hashes': os.path.join(self.folder, f'index_hashes{suffix}.npy'),
+            'index_rows': os.path.join(self.folder, f'index_rows{suffix}.npy')
+        }
+
+    def _set_paths(self, generation):
+        paths = self._paths(generation)
+        self._signatures_path = paths['signatures']
+        self._bandhash_path = paths['bandhash']
+        self._log_path = paths['log']
+        self._index_hashes_path = paths['index_hashes']
+        self._index_rows_path = paths['index_rows']
+
+    def _reset(self, generation):
+        # Forget everything read from an earlier generation's files
+        self._generation = generation
+        self._set_paths(generation)
+        self._log_offset = 0
+        self.row_keys = []
+        self.row_owners = []
+        self.key_to_row = {}
+        self._signatures = None
+        self._bandhash = None
+        self._indexed_rows = 0
+        self._index_hashes = None
+        self._index_rows = None
+
+    @contextmanager
+    def _write_lock(self):
+        with self._thread_lock, open(os.path.join(self.folder, '.lock'), 'w') as lock_file:
+            _lock_file(lock_file)
+            try:
+                yield
+            finally:
+                _unlock_file(lock_file)
+
+    def _read_meta(self):
+        try:
+            with open(self._meta_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_meta(self, indexed_rows, generation):
+        meta = {
+            'num_perm': self.num_perm,
+            'bands': self.bands,
+            'rows': self.rows,
+            'hash_version': self.hash_version,
+            'generation': generation,
+            'indexed_rows': indexed_rows
+        }
+        temp_path = self._meta_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(temp_path, self._meta_path)
+
+    def _check_meta(self):
+        meta = self._read_meta()
+        if meta is None:
+            self._set_paths(0)
+            self._write_meta(0, 0)
+            return
+        self._set_paths(meta.get('generation', 0))
+        # Archives from before the version was recorded used the first scheme
+        if meta.get('hash_version', 1) != self.hash_version:
+            self._rotate(meta.get('hash_version', 1))
+            return
+        layout = (meta['num_perm'], meta['bands'], meta['rows'])
+        if layout != (self.num_perm, self.bands, self.rows):
+            raise ValueError(
+                f"Corpus at {self.folder} uses num_perm/bands/rows {layout}, "
+                f"not {(self.num_perm, self.bands, self.rows)}"
+            )
+
+    def _rotate(self, old_version):
+        stale_folder = os.path.join(self.folder, f"stale-v{old_version}-{int(time.time())}")
+        os.makedirs(stale_folder, exist_ok=True)
+        for path in (self._signatures_path, self._bandhash_path, self._log_path, self._meta_path,
+                     self._index_hashes_path, self._index_rows_path):
+            if os.path.exists(path):
+                os.replace(path, os.path.join(stale_folder, os.path.basename(path)))
+        print(f"Corpus at {self.folder} used shingle hash version {old_version}, not {self.hash_version}; "
+              f"moved it to {stale_folder} and started a new one")
+        self._set_paths(0)
+        self._write_meta(0, 0)
+
+    def refresh(self):
+        """
+        Pick up rows, deletions and index rebuilds written by other processes
+        """
+        with self._thread_lock:
+            self._refresh()
+
+    def _refresh(self):
+        generation = (self._read_meta() or {}).get('generation', 0)
+        if generation != self._generation:
+            self._reset(generation)
+        try:
+            with open(self._log_path, 'rb') as f:
+                f.seek(self._log_offset)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # partially written entry; read it next time
+                    self._log_offset += len(line)
+                    entry = json.loads(line)
+                    if entry['op'] == 'add':
+                        self.row_keys.append(entry['key'])
+                        self.row_owners.append(entry.get('owner') or {})
+                        self.key_to_row[entry['key']] = entry['row']
+                    elif entry['op'] == 'del':
+                        self.key_to_row.pop(entry['key'], None)
+
+            n = len(self.row_keys)
+            self._signatures = self._map(self._signatures_path, n, self.num_perm)
+            self._bandhash = self._map(self._bandhash_path, n, self.bands)
+        except FileNotFoundError:
+            # Another process compacted the corpus after we read meta.json
+            if (self._read_meta() or {}).get('generation', 0) == generation:
+                raise
+            self._refresh()
+            return
+
+        meta = self._read_meta() or {}
+        if meta.get('generation', 0) != generation:
+            self._refresh()
+            return
+        indexed_rows = meta.get('indexed_rows', 0)
+        if indexed_rows != self._indexed_rows or (indexed_rows and self._index_hashes is None):
+            self._indexed_rows = indexed_rows
+            if indexed_rows:
+                self._index_hashes = np.load(self._index_hashes_path, mmap_mode='r')
+                self._index_rows = np.load(self._index_rows_path, mmap_mode='r')
+            else:
+                self._index_hashes = self._index_rows = None
+
+    @staticmethod
+    def _map(path, n, width):
+        if n == 0:
+            return np.empty((0, width), dtype=np.uint64)
+        return np.memmap(path, dtype=np.uint64, mode='r', shape=(n, width))
+
+    def insert_many(self, items, owners=None):
+        """
+        Add or replace signatures for `(key, signature)` pairs.
+        `owners` optionally maps keys to {'submission': id, 'assignment': id},
+        which queries can exclude (see `query`).
+        """
+        items = list(items)
+        if not items:
+            return
+        owners = owners or {}
+        signatures = np.vstack([get_hashvalues(signature) for _, signature in items]).astype(np.uint64)
+        if signatures.shape[1] != self.num_perm:
+            raise ValueError(f"Expected signatures with {self.num_perm} hash values")
+        hashes = band_hashes(signatures, self.bands, self.rows)
+
+        with self._write_lock():
+            self.refresh()
+            self._discard_unlogged()
+            # Keys whose live row already holds this signature and owner need no new row
+            keep = [
+                i for i, (key, _) in enumerate(items)
+                if key not in self.key_to_row
+                or self.row_owners[self.key_to_row[key]] != (owners.get(key) or {})
+                or not np.array_equal(self._signatures[self.key_to_row[key]], signatures[i])
+            ]
+            if not keep:
+                return
+            items = [items[i] for i in keep]
+            signatures = signatures[keep]
+            hashes = hashes[keep]
+            with open(self._signatures_path, 'ab') as f:
+                f.write(np.ascontiguousarray(signatures).tobytes())
+            with open(self._bandhash_path, 'ab') as f:
+                f.write(np.ascontiguousarray(hashes).tobytes())
+
+            lines = []
+            row = len(self.row_keys)
+            for key, _ in items:
+                if key in self.key_to_row:
+                    lines.append(json.dumps({'op': 'del', 'key': key}))
+                entry = {'op': 'add', 'key': key, 'row': row}
+                if owners.get(key):
+                    entry['owner'] = owners[key]
+                lines.append(json.dumps(entry))
+                row += 1
+            with open(self._log_path, 'a') as f:
+                f.write('\n'.join(lines) + '\n')
+
+            self.refresh()
+            if len(self.row_keys) - self._indexed_rows > self.tail_limit:
+                self._rebuild_index()
+
+    def _discard_unlogged(self):
+        # Data rows are appended before the log entries that claim them, so a
+        # writer that died in between leaves rows (or half a log line) no key
+        # owns. Cut them off so new rows land at the ids the log gives them.
+        n = len(self.row_keys)
+        for path, size in ((self._signatures_path, n * self.num_perm * 8),
+                           (self._bandhash_path, n * self.bands * 8),
+                           (self._log_path, self._log_offset)):
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                print(f"Discarding {os.path.getsize(path) - size} unlogged bytes from {path}")
+                os.truncate(path, size)
+
+    def insert(self, key, signature, owner=None):
+        self.insert_many([(key, signature)], {key: owner} if owner else None)
+
+    def delete(self, key):
+        """
+        Remove a key from the corpus; its row stays on disk as a tombstone
+        """
+        with self._write_lock():
+            self.refresh()
+            if key not in self.key_to_row:
+                return
+            self._discard_unlogged()
+            with open(self._log_path, 'a') as f:
+                f.write(json.dumps({'op': 'del', 'key': key}) + '\n')
+            self.refresh()
+
+    def rebuild_index(self):
+        """
+        Re-sort the band index so it covers every row written so far,
+        compacting the corpus first if too many rows are dead
+        """
+        with self._write_lock():
+            self.refresh()
+            self._rebuild_index()
+
+    def _rebuild_index(self):
+        n = len(self.row_keys)
+        if n - len(self.key_to_row) > self.max_dead_fraction * n:
+            self._compact()
+            return
+        self._write_index(np.asarray(self._bandhash[:n]), self._index_hashes_path, self._index_rows_path)
+        self._write_meta(n, self._generation)
+        self._indexed_rows = -1  # force the next refresh to remap the new index
+        self.refresh()
+
+    @staticmethod
+    def _write_index(bandhash, hashes_path, rows_path):
+        hashes = bandhash.T
+        order = np.argsort(hashes, axis=1, kind='stable')
+        for path, array in ((hashes_path, np.take_along_axis(hashes, order, axis=1)),
+                            (rows_path, order.astype(np.int64))):
+            temp_path = path + '.tmp.npy'
+            np.save(temp_path, array)
+            os.replace(temp_path, path)
+
+    def _compact(self, chunk_size=65536):
+        # Copy the live rows into the next generation's files, index them, then
+        # switch meta.json over; readers move to the new files on refresh
+        live = np.array(sorted(self.key_to_row.values()), dtype=np.int64)
+        generation = self._generation + 1
+        paths = self._paths(generation)
+        for name, source in (('signatures', self._signatures), ('bandhash', self._bandhash)):
+            with open(paths[name], 'wb') as f:
+                for start in range(0, len(live), chunk_size):
+                    f.write(np.ascontiguousarray(source[live[start:start + chunk_size]]).tobytes())
+        with open(paths['log'], 'w') as f:
+            for new_row, row in enumerate(live):
+                entry = {'op': 'add', 'key': self.row_keys[row], 'row': new_row}
+                if self.row_owners[row]:
+                    entry['owner'] = self.row_owners[row]
+                f.write(json.dumps(entry) + '\n')
+        if len(live):
+            bandhash = np.fromfile(paths['bandhash'], dtype=np.uint64).reshape(len(live), self.bands)
+            self._write_index(bandhash, paths['index_hashes'], paths['index_rows'])
+        self._write_meta(len(live), generation)
+
+        print(f"Compacted corpus at {self.folder}: {len(self.row_keys)} rows to {len(live)}")
+        self._reset(generation)
+        # Readers that still map old files keep them until they refresh (on
+        # Windows they cannot be removed yet, so every compaction retries)
+        for old_generation in range(generation):
+            for path in self._paths(old_generation).values():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        self.refresh()
+
+    def _candidate_rows(self, hashes):
+        candidates = []
+        if self._index_hashes is not None:
+            for band in range(self.bands):
+                band_hashes_sorted = self._index_hashes[band]
+                lo = np.searchsorted(band_hashes_sorted, hashes[band], side='left')
+                hi = np.searchsorted(band_hashes_sorted, hashes[band], side='right')
+                if hi > lo:
+                    candidates.append(np.asarray(self._index_rows[band, lo:hi]))
+        start = max(self._indexed_rows, 0)
+        if start < len(self.row_keys):
+            tail = np.asarray(self._bandhash[start:])
+            candidates.append(np.flatnonzero((tail == hashes).any(axis=1)) + start)
+        if not candidates:
+            return np.empty(0, dtype=np.int64)
+        rows = np.unique(np.concatenate(candidates))
+        # An index rebuilt by another process since our last refresh may cover rows we have not read yet
+        return rows[rows < len(self.row_keys)]
+
+    def query(self, signature, exclude=(), exclude_submissions=(), exclude_assignment=None):
+        """
+        Find archived signatures sharing an LSH band with `signature`.
+
+        Rows whose key is in `exclude`, whose owner submission is in
+        `exclude_submissions` or whose owner assignment is `exclude_assignment`
+        are skipped, so a student's earlier drafts of the same work never count.
+
+        Returns:
+            list: (key, estimated Jaccard similarity) for each remaining live
+            candidate, most similar first
+        """
+        signature = get_hashvalues(signature).astype(np.uint64)
+        hashes = band_hashes(signature[np.newaxis, :], self.bands, self.rows)[0]
+        with self._thread_lock:
+            return self._query(signature, hashes, exclude, exclude_submissions, exclude_assignment)
+
+    def _excluded_owner(self, row, exclude_submissions, exclude_assignment):
+        owner = self.row_owners[row]
+        if owner.get('submission') is not None and owner['submission'] in exclude_submissions:
+            return True
+        return exclude_assignment is not None and owner.get('assignment') == exclude_assignment
+
+    def _query(self, signature, hashes, exclude, exclude_submissions, exclude_assignment):
+        rows = [
+            row for row in self._candidate_rows(hashes)
+            if self.key_to_row.get(self.row_keys[row]) == row and self.row_keys[row] not in exclude
+            and not self._excluded_owner(row, exclude_submissions, exclude_assignment)
+        ]
+        if not rows:
+            return []
+        sims = np.count_nonzero(np.asarray(self._signatures[rows]) == signature, axis=1) / self.num_perm
+        matches = [(self.row_keys[row], float(sim)) for row, sim in zip(rows, sims)]
+        return sorted(matches, key=lambda match: match[1], reverse=True)
+
+    def __len__(self):
+        return len(self.key_to_row)
+
+    def __contains__(self, key):
+        return key in self.key_to_row
@@ -0,0 +1,93 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+# Bump when the layout of state entries changes
+STATE_FORMAT_VERSION = 2
+
+
+def course_state_key(data):
+    """
+    Return the key of the course assignment a courseWork payload belongs to,
+    or None when the payload does not identify it.
+
+    Uses `assignmentInfo.courseId` and `assignmentInfo.id` (a Classroom
+    CourseWork), falling back to the `courseId` and `courseWorkId` of the
+    first submission (a Classroom StudentSubmission).
+    """
+    info = data.get('assignmentInfo') or {}
+    course_id, work_id = info.get('courseId'), info.get('id')
+    if not (course_id and work_id):
+        submissions = data.get('courseWork') or [{}]
+        course_id, work_id = submissions[0].get('courseId'), submissions[0].get('courseWorkId')
+    if not (course_id and work_id):
+        return None
+    return f"{course_id}/{work_id}"
+
+
+def is_unchanged(entry, attachment):
+    """
+    Whether an attachment is known to be unchanged since `entry` was stored
+    without downloading it: same Drive file and same submission update time
+    """
+    return (
+        attachment.get('update_time') is not None
+        and entry.get('file_id') == attachment['file_id']
+        and entry.get('update_time') == attachment['update_time']
+    )
+
+
+class CourseStateStore:
+    """
+    On-disk state of the last run of each course assignment.
+
+    One pickle per course assignment maps every attachment key to its Drive
+    file id, submission update time, content hash, MinHash signature, in-class
+    plagiarism maximum and its match, and grade. Entries stored under a
+    different settings `version` are ignored, so a change to extraction,
+    hashing or the grading prompt forces a full run.
+    Writes are atomic; concurrent runs of one assignment keep the last write.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.folder, f"{hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]}.pkl")
+
+    def load(self, key, version):
+        """
+        Return the stored entries for a course assignment, or {} when there are
+        none for this settings version
+        """
+        try:
+            with open(self._path(key), 'rb') as f:
+                state = pickle.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"Discarding unreadable course state for {key}: {str(e)}")
+            return {}
+        if state.get('format') != STATE_FORMAT_VERSION or state.get('version') != version or state.get('key') != key:
+            return {}
+        return state['entries']
+
+    def save(self, key, version, entries):
+        """
+        Replace the stored entries for a course assignment
+        """
+        state = {'format': STATE_FORMAT_VERSION, 'key': key, 'version': version, 'entries': entries}
+        fd, temp_path = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self._path(key))
+        except Exception:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
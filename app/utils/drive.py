@@ -0,0 +1,89 @@
+import hashlib
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DRIVE_API_BASE = "https://www.googleapis.com/drive/v3"
+
+
+def create_drive_session(max_connections=8, retries=3, backoff_factor=0.5):
+    """
+    Create a pooled HTTP session for Drive downloads.
+
+    Connections are reused across downloads and GET requests are retried with
+    exponential backoff on 429 and 5xx responses, honouring Retry-After.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def download_drive_file(session, file_id, access_token, dest_path, base_url=DRIVE_API_BASE,
+                        chunk_size=1024 * 1024, timeout=60):
+    """
+    Download a file from Google Drive using the file ID and an access token
+
+    The body is streamed to `dest_path` in chunks and hashed on the way, so the
+    whole file is never held in memory.
+
+    Args:
+        session (requests.Session): Session from create_drive_session
+        file_id (str): The Google Drive file ID
+        access_token (str): OAuth2 access token for Google Drive API
+        dest_path (str): Where to write the file content
+
+    Returns:
+        str: SHA-256 hex digest of the content, or None if download failed
+    """
+    # Using the Google Drive API v3 endpoint to download file content
+    download_url = f"{base_url}/files/{file_id}?alt=media"
+
+    # Set up authentication headers with the access token
+    headers = {
+        "Authorization": f"Bearer {access_token}"
+    }
+
+    try:
+        print(f"Downloading file {file_id} using access token")
+        with session.get(download_url, headers=headers, stream=True, timeout=timeout) as response:
+            if response.status_code != 200:
+                print(f"Failed to download file: HTTP {response.status_code}")
+                print(f"Response: {response.text}")
+
+                # If token expired (401) or insufficient permissions (403), provide more info
+                if response.status_code == 401:
+                    print("Authentication failed: Access token may be expired")
+                elif response.status_code == 403:
+                    print("Access denied: Insufficient permissions to access this file")
+
+                return None
+
+            digest = hashlib.sha256()
+            with open(dest_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        f.write(chunk)
+                        digest.update(chunk)
+
+        print(f"Successfully downloaded file {file_id}")
+        return digest.hexdigest()
+    except Exception as e:
+        print(f"Error downloading file: {str(e)}")
+        try:
+            os.unlink(dest_path)
+        except OSError:
+            pass
+        return None
+
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+# Bump when the layout of cache entries, the text-layer reading mode or the
+# shingle hashing scheme changes
+CACHE_FORMAT_VERSION = 3
+
+
+def content_hash(data):
+    """
+    Return the SHA-256 hex digest used to address a PDF in the cache
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def settings_version(**settings):
+    """
+    Build a version stamp from the settings that affect extraction and hashing.
+    Entries written under different settings are treated as misses.
+    """
+    payload = json.dumps({'format': CACHE_FORMAT_VERSION, **settings}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class ExtractionCache:
+    """
+    Content-addressed on-disk cache of extraction results.
+
+    Each PDF is stored under the SHA-256 of its bytes with its extracted text,
+    shingle set and MinHash signature. Reads refresh the entry's mtime and the
+    least recently used entries are evicted once the cache exceeds `max_bytes`.
+    """
+
+    def __init__(self, folder, max_bytes, version):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.version = version
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, digest):
+        return os.path.join(self.folder, f"{digest}.pkl")
+
+    def get(self, digest):
+        """
+        Return the cached entry for a PDF hash, or None on a miss
+        """
+        path = self._path(digest)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Discarding unreadable cache entry {digest}: {str(e)}")
+            self._remove(path)
+            return None
+
+        if entry.get('version') != self.version:
+            self._remove(path)
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def put(self, digest, text, shingles, signature):
+        """
+        Store the extraction results for a PDF hash and evict old entries if needed
+        """
+        entry = {
+            'version': self.version,
+            'text': text,
+            'shingles': shingles,
+            'signature': signature
+        }
+        fd, temp_path = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self._path(digest))
+        except Exception:
+            self._remove(temp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """
+        Delete least recently used entries until the cache fits in max_bytes
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.folder):
+            if not name.endswith('.pkl'):
+                continue
+            path = os.path.join(self.folder, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
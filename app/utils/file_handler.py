@@ -1,7 +1,85 @@
+import multiprocessing
+import os
+import subprocess
+import threading
+import time
+import numpy as np
 from flask import current_app
-from pdf2image import convert_from_path
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image
+from pdf2image import convert_from_path, pdfinfo_from_path
 import pytesseract
 
+# Settings for adaptive OCR (see ocr_page); pass a dict with any of these keys
+# as `ocr_options` to enable it
+ADAPTIVE_OCR_DEFAULTS = {
+    'probe_dpi': 72,  # Resolution of the quick layout probe
+    'min_dpi': 150,
+    'max_dpi': 300,
+    'target_line_height': 32,  # Text line height in pixels Tesseract should see (~10pt at 275 DPI)
+    'blank_ink_ratio': 0.002,  # Pages with less ink than this are skipped
+    'min_confidence': 60,  # Mean word confidence below which a page is re-OCR'd at higher DPI
+    'margin': 0.1  # Inches of whitespace kept around the cropped content
+}
+
+class OCRPool:
+    """
+    Long-lived pool of OCR processes shared by every extraction in one process.
+
+    Workers are started on first use with forkserver (spawn where forkserver is
+    unavailable), never forked from the multi-threaded server, and stay up for
+    later PDFs. A pool broken by a dying worker is replaced on the next call.
+    Concurrent extractions share the pool, so a process never runs more than
+    `workers` OCR processes.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if 'forkserver' in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context('forkserver')
+                    context.set_forkserver_preload([__name__])
+                else:
+                    context = multiprocessing.get_context('spawn')
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._executor
+
+    def map(self, func, *iterables):
+        """
+        Run `func` over the iterables in the pool and return the results in order
+        """
+        executor = self._get_executor()
+        try:
+            return list(executor.map(func, *iterables))
+        except BrokenProcessPool:
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            raise
+
+    def pids(self):
+        """
+        Return the process ids of the running pool workers
+        """
+        with self._lock:
+            processes = getattr(self._executor, '_processes', None) or {}
+            return list(processes)
+
+    def shutdown(self):
+        # A pool inherited through fork belongs to the parent; leave it alone
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and os.getpid() == self._pid:
+            executor.shutdown()
+
 def allowed_file(filename):
     """
     Check if the file has an allowed extension
@@ -9,20 +87,348 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
 
-def extract_text_from_pdf(pdf_path):
+def _native_page_texts(pdf_path, first_page, last_page):
+    """
+    Read the embedded text layer of a page range with poppler's pdftotext, in
+    reading order (layout mode pads columns with runs of spaces that split
+    sentences across lines).
+    Returns one string per page, or None if pdftotext is unavailable or fails.
+    """
+    try:
+        result = subprocess.run(
+            ['pdftotext', '-f', str(first_page), '-l', str(last_page), pdf_path, '-'],
+            capture_output=True,
+            check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    # pdftotext terminates every page with a form feed
+    pages = result.stdout.decode('utf-8', errors='replace').split('\f')
+    return pages[:last_page - first_page + 1]
+
+def _page_image_coverage(pdf_path, first_page, last_page):
     """
-    Extract text from a PDF file using pdf2image and pytesseract
+    Estimate the fraction of each page in a range covered by raster images,
+    from poppler's `pdfinfo` page sizes and `pdfimages -list` placements.
+    Returns {page number: fraction}, or None if poppler is unavailable or fails.
     """
     try:
-        pages = convert_from_path(pdf_path, dpi=200)
+        info = subprocess.run(
+            ['pdfinfo', '-f', str(first_page), '-l', str(last_page), pdf_path],
+            capture_output=True,
+            check=True
+        ).stdout.decode('utf-8', errors='replace')
+        listing = subprocess.run(
+            ['pdfimages', '-f', str(first_page), '-l', str(last_page), '-list', pdf_path],
+            capture_output=True,
+            check=True
+        ).stdout.decode('utf-8', errors='replace')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    # "Page    1 size: 612 x 792 pts (letter)"
+    page_areas = {}
+    for line in info.splitlines():
+        fields = line.split()
+        if len(fields) >= 6 and fields[0] == 'Page' and fields[2] == 'size:':
+            try:
+                page_areas[int(fields[1])] = float(fields[3]) * float(fields[5])
+            except ValueError:
+                continue
+
+    # "page num type width height color comp bpc enc interp object ID x-ppi y-ppi size ratio";
+    # the pixel size over the placement resolution gives the drawn size in inches
+    covered = {}
+    for line in listing.splitlines()[2:]:
+        fields = line.split()
+        if len(fields) < 14 or fields[2] != 'image':
+            continue
+        try:
+            page = int(fields[0])
+            width, height = int(fields[3]), int(fields[4])
+            x_ppi, y_ppi = float(fields[-4]), float(fields[-3])
+        except ValueError:
+            continue
+        if x_ppi > 0 and y_ppi > 0:
+            covered[page] = covered.get(page, 0.0) + (width / x_ppi * 72) * (height / y_ppi * 72)
+
+    return {
+        page: min(1.0, covered.get(page, 0.0) / area) if area > 0 else 0.0
+        for page, area in page_areas.items()
+    }
+
+def has_usable_text_layer(page_text, min_chars=50, image_coverage=None, max_image_coverage=None):
+    """
+    Decide whether a page's embedded text is good enough to skip OCR.
+    Requires at least `min_chars` non-whitespace characters, mostly alphanumeric,
+    and, when both are given, images covering less than `max_image_coverage` of
+    the page (a typed header over a scanned handwritten answer needs OCR).
+    """
+    if image_coverage is not None and max_image_coverage is not None and image_coverage >= max_image_coverage:
+        return False
+    chars = [c for c in page_text if not c.isspace()]
+    if len(chars) < min_chars:
+        return False
+    alnum = sum(1 for c in chars if c.isalnum())
+    return alnum / len(chars) >= 0.5
+
+def _ink_mask(image):
+    """
+    Binarize a grayscale page with Otsu's threshold.
+    Returns a boolean array that is True on ink (dark) pixels.
+    """
+    pixels = np.asarray(image.convert('L'), dtype=np.uint8)
+    histogram = np.bincount(pixels.ravel(), minlength=256).astype(np.float64)
+    weight = np.cumsum(histogram)
+    weighted = np.cumsum(histogram * np.arange(256))
+    background = weight[-1] - weight
+    with np.errstate(divide='ignore', invalid='ignore'):
+        between = (weighted[-1] * weight - weighted * weight[-1]) ** 2 / (weight * background)
+    threshold = int(np.argmax(np.nan_to_num(np.where(background > 0, between, 0))))
+    # Near-uniform pages get an arbitrary Otsu split; only clearly dark pixels count as ink
+    return (pixels <= threshold) & (pixels < 200)
+
+def _page_layout(mask, min_fill=0.005):
+    """
+    Find the content bounding box and median text line height of a binarized page.
+    Rows and columns with less than `min_fill` ink are treated as margin or noise.
+
+    Returns:
+        tuple: ((left, top, right, bottom) or None, line height in pixels or None)
+    """
+    rows = mask.sum(axis=1) > max(1, min_fill * mask.shape[1])
+    columns = mask.sum(axis=0) > max(1, min_fill * mask.shape[0])
+    if not rows.any() or not columns.any():
+        return None, None
+    row_ids = np.flatnonzero(rows)
+    column_ids = np.flatnonzero(columns)
+    box = (column_ids[0], row_ids[0], column_ids[-1] + 1, row_ids[-1] + 1)
+
+    # Text lines are runs of inked rows in the horizontal projection
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], rows.astype(np.int8), [0]))))
+    runs = edges[1::2] - edges[0::2]
+    return box, float(np.median(runs))
+
+def _ocr_with_confidence(image):
+    """
+    OCR an image and return its text with the mean word confidence (0-100)
+    """
+    data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+    lines = {}
+    confidences = []
+    for i, word in enumerate(data['text']):
+        if not word.strip():
+            continue
+        key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        lines.setdefault(key, []).append(word)
+        confidence = float(data['conf'][i])
+        if confidence >= 0:
+            confidences.append(confidence)
+
+    text = ""
+    previous = None
+    for key, words in lines.items():
+        if previous is not None:
+            text += "\n\n" if key[:2] != previous[:2] else "\n"
+        text += " ".join(words)
+        previous = key
+    return text, (sum(confidences) / len(confidences) if confidences else 0.0)
+
+def _render_page(pdf_path, page_number, dpi, grayscale=False):
+    pages = convert_from_path(pdf_path, dpi=dpi, first_page=page_number, last_page=page_number, grayscale=grayscale)
+    return pages[0] if pages else None
+
+def ocr_page(pdf_path, page_number, dpi=200, ocr_options=None):
+    """
+    Rasterize and OCR one page of a PDF.
+
+    Without `ocr_options` the page is rendered in colour at `dpi`. With them
+    (see ADAPTIVE_OCR_DEFAULTS) a low-resolution grayscale probe decides how
+    the page is read:
+        - pages with almost no ink are skipped as blank
+        - the DPI is chosen so text lines are about `target_line_height` pixels tall
+        - the page is rendered in grayscale, binarized and cropped to its content
+        - pages whose mean word confidence is under `min_confidence` are
+          OCR'd again at a higher DPI, keeping the more confident result
+
+    Returns:
+        tuple: (text, info) where info has the `dpi` used and whether the page
+        was `blank` or `reocr`'d
+    """
+    info = {'dpi': dpi, 'blank': False, 'reocr': False, 'confidence': None}
+    if ocr_options is None:
+        image = _render_page(pdf_path, page_number, dpi)
+        return (pytesseract.image_to_string(image) if image else ""), info
+
+    options = {**ADAPTIVE_OCR_DEFAULTS, **ocr_options}
+    probe_dpi = options['probe_dpi']
+    probe = _render_page(pdf_path, page_number, probe_dpi, grayscale=True)
+    if probe is None:
+        return "", info
+    mask = _ink_mask(probe)
+    if mask.mean() < options['blank_ink_ratio']:
+        info.update(dpi=None, blank=True)
+        return "", info
+
+    box, line_height = _page_layout(mask)
+    if box is None:
+        info.update(dpi=None, blank=True)
+        return "", info
+    if line_height:
+        dpi = probe_dpi * options['target_line_height'] / line_height
+    dpi = int(min(max(round(dpi / 25) * 25, options['min_dpi']), options['max_dpi']))
+
+    def read(render_dpi):
+        image = _render_page(pdf_path, page_number, render_dpi, grayscale=True)
+        if image is None:
+            return None
+        scale = render_dpi / probe_dpi
+        pad = options['margin'] * render_dpi
+        crop = (
+            max(0, int(box[0] * scale - pad)),
+            max(0, int(box[1] * scale - pad)),
+            min(image.width, int(box[2] * scale + pad)),
+            min(image.height, int(box[3] * scale + pad))
+        )
+        binarized = Image.fromarray(np.where(_ink_mask(image.crop(crop)), 0, 255).astype(np.uint8))
+        return _ocr_with_confidence(binarized)
+
+    result = read(dpi)
+    if result is None:
+        return "", info
+    text, confidence = result
+    info.update(dpi=dpi, confidence=confidence)
+    if confidence < options['min_confidence'] and dpi < options['max_dpi']:
+        retry_dpi = int(min(dpi * 1.5, options['max_dpi']))
+        retry = read(retry_dpi)
+        info['reocr'] = True
+        if retry is not None and retry[1] > confidence:
+            text, confidence = retry
+            info.update(dpi=retry_dpi, confidence=confidence)
+    return text, info
+
+def _extract_page_range(pdf_path, first_page, last_page, dpi, native_min_chars, ocr_options=None,
+                        native_max_image_coverage=None):
+    """
+    Extract a contiguous range of pages, using the text layer where it is usable
+    and rasterizing + OCR'ing only the remaining pages, one page at a time.
+    """
+    start = time.perf_counter()
+    native_texts = None
+    image_coverage = None
+    if native_min_chars is not None:
+        native_texts = _native_page_texts(pdf_path, first_page, last_page)
+        if native_texts and native_max_image_coverage is not None:
+            image_coverage = _page_image_coverage(pdf_path, first_page, last_page)
+    native_seconds = time.perf_counter() - start
+
+    page_texts = []
+    ocr_seconds = 0.0
+    native_pages = 0
+    blank_pages = 0
+    reocr_pages = 0
+    for offset, page_number in enumerate(range(first_page, last_page + 1)):
+        if native_texts and offset < len(native_texts) and \
+                has_usable_text_layer(native_texts[offset], native_min_chars,
+                                      (image_coverage or {}).get(page_number), native_max_image_coverage):
+            page_texts.append(native_texts[offset])
+            native_pages += 1
+            continue
+        start = time.perf_counter()
+        page_text, info = ocr_page(pdf_path, page_number, dpi, ocr_options)
+        page_texts.append(page_text)
+        blank_pages += info['blank']
+        reocr_pages += info['reocr']
+        ocr_seconds += time.perf_counter() - start
+
+    return {
+        'texts': page_texts,
+        'native_pages': native_pages,
+        'ocr_pages': len(page_texts) - native_pages,
+        'blank_pages': blank_pages,
+        'reocr_pages': reocr_pages,
+        'native_seconds': native_seconds,
+        'ocr_seconds': ocr_seconds
+    }
+
+def extract_text_from_pdf_with_stats(pdf_path, dpi=200, workers=1, pages_per_task=4, native_min_chars=50,
+                                     ocr_options=None, pool=None, native_max_image_coverage=0.5):
+    """
+    Extract text from a PDF file, preferring the embedded text layer over OCR.
+
+    Pages are processed in ranges of `pages_per_task` across `pool` (an
+    OCRPool), or without a pool across a temporary one of `workers` processes
+    (a server should pass its long-lived pool instead). Pages whose text layer
+    is missing or unusable, or that are mostly covered by images, are rasterized
+    and OCR'd with pytesseract; pass `native_min_chars=None` to always OCR, or
+    `native_max_image_coverage=None` to trust any usable text layer.
+    `ocr_options` switches OCR to the adaptive mode of ocr_page.
+    Page order is preserved in the output.
+
+    Returns:
+        tuple: (text, stats) where stats counts native vs OCR'd pages (and
+        blank or re-OCR'd pages among them) and the time spent on each path
+    """
+    stats = {
+        'pages': 0, 'native_pages': 0, 'ocr_pages': 0, 'blank_pages': 0, 'reocr_pages': 0,
+        'native_seconds': 0.0, 'ocr_seconds': 0.0
+    }
+    try:
+        page_count = pdfinfo_from_path(pdf_path)['Pages']
     except Exception as e:
         print(f"Error converting {pdf_path}: {e}")
-        return ""
+        return "", stats
+
+    ranges = [
+        (first, min(first + pages_per_task - 1, page_count))
+        for first in range(1, page_count + 1, pages_per_task)
+    ]
+
+    owns_pool = pool is None and workers > 1 and len(ranges) > 1
+    if owns_pool:
+        pool = OCRPool(min(workers, len(ranges)))
+    try:
+        if pool is not None and len(ranges) > 1:
+            results = pool.map(
+                _extract_page_range,
+                [pdf_path] * len(ranges),
+                [first for first, _ in ranges],
+                [last for _, last in ranges],
+                [dpi] * len(ranges),
+                [native_min_chars] * len(ranges),
+                [ocr_options] * len(ranges),
+                [native_max_image_coverage] * len(ranges)
+            )
+        else:
+            results = [
+                _extract_page_range(pdf_path, first, last, dpi, native_min_chars, ocr_options,
+                                    native_max_image_coverage)
+                for first, last in ranges
+            ]
+    except Exception as e:
+        print(f"Error extracting text from {pdf_path}: {e}")
+        return "", stats
+    finally:
+        if owns_pool:
+            pool.shutdown()
 
     text = ""
-    for page in pages:
-        page_text = pytesseract.image_to_string(page)
-        text += page_text + "\n"
+    for result in results:
+        for page_text in result['texts']:
+            text += page_text + "\n"
+        for field in ('native_pages', 'ocr_pages', 'blank_pages', 'reocr_pages', 'native_seconds', 'ocr_seconds'):
+            stats[field] += result[field]
+    stats['pages'] = page_count
 
-    print(f"Extracted text from {pdf_path}")
-    return text
\ No newline at end of file
+    print(f"Extracted text from {pdf_path} "
+          f"({stats['native_pages']} native, {stats['ocr_pages']} OCR'd pages)")
+    return text, stats
+
+def extract_text_from_pdf(pdf_path, dpi=200, workers=1, pages_per_task=4, native_min_chars=50, ocr_options=None,
+                          pool=None):
+    """
+    Extract text from a PDF file, using the text layer where present and OCR otherwise
+    """
+    text, _ = extract_text_from_pdf_with_stats(pdf_path, dpi, workers, pages_per_task, native_min_chars,
+                                               ocr_options, pool)
+    return text
@@ -1,38 +1,156 @@
 import re
+import json
+import time
+import random
 import hashlib
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# Global API cache to avoid duplicate calls
-api_cache = {}
+from app.utils.cache import MemoryLRUCache
 
-def call_gemini_api_cached(assignment_text, context, pdf_context_extract=None, api_key=None):
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta"
+GEMINI_MODEL = "gemini-2.0-flash"
+# (connect, read) seconds before a Gemini request is abandoned and retried
+GEMINI_TIMEOUT = (10, 120)
+
+# Default cache for callers that do not pass one; bounded so long-lived workers do not grow forever
+api_cache = MemoryLRUCache(max_entries=1024)
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter shared by all grading threads.
+    Allows bursts of up to `capacity` requests and refills at `rate_per_minute`.
     """
-    Calls the Gemini API to grade the provided assignment.
-    Combines dynamic context, optional PDF context, and the assignment text.
-    Uses caching to avoid duplicate calls.
 
-    The function extracts the exact numerical grade from the response.
+    def __init__(self, rate_per_minute, capacity=1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until a request may be sent
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def _post_with_retry(api_url, headers, payload, rate_limiter=None, max_retries=5, backoff_base=1.0, backoff_max=60.0,
+                     timeout=GEMINI_TIMEOUT):
+    """
+    POST to the Gemini API, retrying 429 and 5xx responses and requests that
+    exceed `timeout` with jittered exponential backoff.
+    A Retry-After header, when present, is used as the minimum wait.
+    Raises requests.Timeout if the last attempt times out.
     """
-    # Create a combined string for caching
-    combined_for_hash = assignment_text + (pdf_context_extract if pdf_context_extract else "")
-    text_hash = hashlib.md5(combined_for_hash.encode('utf-8')).hexdigest()
-    if text_hash in api_cache:
-        return api_cache[text_hash]
+    for attempt in range(max_retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            response = requests.post(api_url, headers=headers, json=payload, timeout=timeout)
+        except requests.Timeout:
+            if attempt == max_retries:
+                raise
+            response = None
+        else:
+            if response.status_code != 429 and response.status_code < 500:
+                return response
+            if attempt == max_retries:
+                break
 
-    # API URL
-    api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
-    headers = {"Content-Type": "application/json"}
+        delay = random.uniform(0, min(backoff_max, backoff_base * (2 ** attempt)))
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        reason = f"returned {response.status_code}" if response is not None else "timed out"
+        print(f"Gemini API {reason}, retrying in {delay:.1f}s")
+        time.sleep(delay)
+    return response
 
-    # Build the complete prompt text
+def grading_cache_key(assignment_text, context, pdf_context_extract=None, model=GEMINI_MODEL):
+    """
+    Build the cache key for a grading request from everything that shapes the prompt
+    """
+    digest = hashlib.sha256()
+    for part in (model, context, pdf_context_extract or "", assignment_text):
+        encoded = part.encode('utf-8')
+        # Length-prefix each part so different splits of the same bytes cannot collide
+        digest.update(len(encoded).to_bytes(8, 'big'))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+def estimate_tokens(text):
+    """
+    Rough prompt token count (about four characters per token for English text)
+    """
+    return len(text) // 4 + 1
+
+def build_grading_prompt(assignment_text, context, pdf_context_extract=None):
+    """
+    Build the prompt used to grade a single assignment
+    """
     complete_prompt = context + "\n"
     if pdf_context_extract:
         complete_prompt += pdf_context_extract + "\n"
     complete_prompt += "Assignment Work: " + assignment_text
-    
-    
+
     # Add explicit grading instructions
     complete_prompt += "\n\nEvaluate this assignment based on the assignment description above. Provide detailed feedback and assign a numerical grade out of 100. If the submission is completely irrelevant to the assignment topic, the grade should be 0. Please start your response with 'Overall Grade: X/100' where X is the numerical grade."
+    return complete_prompt
+
+def _candidate_text(result_data):
+    """
+    Return the generated text of the first candidate in a generateContent response, or None
+    """
+    candidates = result_data.get("candidates", [])
+    if not candidates:
+        return None
+    candidate = candidates[0]
+    if "content" in candidate:
+        parts = candidate["content"].get("parts", [])
+        return parts[0].get("text", "").strip() if parts else ""
+    return candidate.get("output", "").strip()
 
+def call_gemini_api_cached(assignment_text, context, pdf_context_extract=None, api_key=None,
+                           api_base=GEMINI_API_BASE, model=GEMINI_MODEL, rate_limiter=None, max_retries=5,
+                           cache=None, timeout=GEMINI_TIMEOUT):
+    """
+    Calls the Gemini API to grade the provided assignment.
+    Combines dynamic context, optional PDF context, and the assignment text.
+    Uses `cache` (any backend from app.utils.cache, default: api_cache) to avoid
+    duplicate calls; failed API calls are not cached.
+
+    The function extracts the exact numerical grade from the response.
+    Requests go through `rate_limiter` (a TokenBucket) when given and are
+    retried on 429/5xx responses and after `timeout` (connect, read) seconds;
+    a request that times out on every attempt raises requests.Timeout.
+    """
+    if cache is None:
+        cache = api_cache
+    cache_key = grading_cache_key(assignment_text, context, pdf_context_extract, model)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # API URL
+    api_url = f"{api_base}/models/{model}:generateContent?key={api_key}"
+    headers = {"Content-Type": "application/json"}
+
+    # Build the complete prompt text
+    complete_prompt = build_grading_prompt(assignment_text, context, pdf_context_extract)
 
     payload = {
         "contents": [{
@@ -44,20 +162,13 @@ def call_gemini_api_cached(assignment_text, context, pdf_context_extract=None, a
     print("Sending prompt with length:", len(complete_prompt))
    
     # Send the POST request to the Gemini API
-    response = requests.post(api_url, headers=headers, json=payload)
+    response = _post_with_retry(api_url, headers, payload, rate_limiter, max_retries, timeout=timeout)
 
     if response.status_code == 200:
         result_data = response.json()
         print("Gemini API response received")
-        candidates = result_data.get("candidates", [])
-        if candidates:
-            candidate = candidates[0]
-            if "content" in candidate:
-                parts = candidate["content"].get("parts", [])
-                generated_text = parts[0].get("text", "").strip() if parts else ""
-            else:
-                generated_text = candidate.get("output", "").strip()
-        else:
+        generated_text = _candidate_text(result_data)
+        if generated_text is None:
             generated_text = ("Detailed evaluation: The assignment is well-organized and covers key technical aspects "
                               "comprehensively; however, there is room for improvement in analytical depth and clarity.")
     else:
@@ -81,5 +192,236 @@ def call_gemini_api_cached(assignment_text, context, pdf_context_extract=None, a
         cleaned_feedback = generated_text
 
     result = {"grade": exact_grade, "feedback": cleaned_feedback}
-    api_cache[text_hash] = result
+    if response.status_code == 200:
+        cache.set(cache_key, result)
     return result
+
+def grade_texts_concurrently(texts, context, pdf_context_extract=None, api_key=None,
+                             max_in_flight=4, on_result=None, **kwargs):
+    """
+    Grade several texts with call_gemini_api_cached using a bounded thread pool.
+
+    At most `max_in_flight` requests are outstanding at once; pass a shared
+    `rate_limiter` in kwargs to also respect the API quota. `on_result(index, result)`
+    is called as each grade arrives. Each text is read from `texts` only when its
+    request starts, so a lazy sequence (TextStore.joined) keeps just the
+    in-flight texts in memory.
+
+    Returns:
+        list: One {grade, feedback} dict per text, in input order, or None where grading failed
+    """
+    results = [None] * len(texts)
+    if not texts:
+        return results
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        def grade(index):
+            return call_gemini_api_cached(texts[index], context, pdf_context_extract, api_key, **kwargs)
+
+        futures = {executor.submit(grade, index): index for index in range(len(texts))}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                print(f"Error grading text {index}: {str(e)}")
+                continue
+            if on_result is not None:
+                on_result(index, results[index])
+    return results
+
+BATCH_INSTRUCTIONS = """
+Grade each submission below independently against the assignment description above. Each submission is enclosed in <submission id="..."> tags.
+Respond with only a JSON array containing one object per submission, in the form:
+[{"id": "<submission id>", "grade": <integer from 0 to 100>, "feedback": "<detailed, constructive feedback>"}]
+If a submission is completely irrelevant to the assignment topic, its grade should be 0.
+"""
+
+def build_batch_prompt(items, context, pdf_context_extract=None):
+    """
+    Build one prompt that grades several `(id, text)` submissions, sharing the
+    rubric and PDF context between them
+    """
+    prompt = context + "\n"
+    if pdf_context_extract:
+        prompt += pdf_context_extract + "\n"
+    prompt += BATCH_INSTRUCTIONS
+    for item_id, text in items:
+        # Keep submission text from closing its own tag early
+        text = text.replace("</submission>", "</ submission>")
+        prompt += f'\n<submission id="{item_id}">\n{text}\n</submission>\n'
+    return prompt
+
+def pack_batches(texts, context, pdf_context_extract=None, token_budget=24000, max_batch_size=8):
+    """
+    Greedily pack texts (any iterable), in order, into batches whose estimated prompt size stays
+    within `token_budget` (shared preamble included).
+    A text too large to share a prompt ends up in a batch of its own.
+
+    Returns:
+        list: Lists of indexes into `texts`
+    """
+    overhead = estimate_tokens(build_batch_prompt([], context, pdf_context_extract))
+    batches = []
+    current, used = [], overhead
+    for index, text in enumerate(texts):
+        cost = estimate_tokens(text) + 10  # tag and id
+        if current and (used + cost > token_budget or len(current) >= max_batch_size):
+            batches.append(current)
+            current, used = [], overhead
+        current.append(index)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+def parse_batch_response(generated_text, ids):
+    """
+    Parse a batch grading response into {id: {grade, feedback}}.
+    Entries with unknown ids or without a usable grade are dropped, so the
+    caller can regrade whatever is missing.
+
+    Raises:
+        ValueError: If the response does not contain a JSON array
+    """
+    text = generated_text.strip()
+    # Models sometimes wrap JSON in a Markdown code fence
+    fence = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
+    if fence:
+        text = fence.group(1)
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end < start:
+        raise ValueError("No JSON array in batch grading response")
+    entries = json.loads(text[start:end + 1])
+    if not isinstance(entries, list):
+        raise ValueError("Batch grading response is not a JSON array")
+
+    wanted = {str(item_id) for item_id in ids}
+    results = {}
+    for entry in entries:
+        if not isinstance(entry, dict) or str(entry.get("id")) not in wanted:
+            continue
+        try:
+            grade = int(round(float(entry["grade"])))
+        except (KeyError, TypeError, ValueError):
+            continue
+        results[str(entry["id"])] = {
+            "grade": min(100, max(0, grade)),
+            "feedback": str(entry.get("feedback", "")).strip()
+        }
+    return results
+
+def call_gemini_batch(items, context, pdf_context_extract=None, api_key=None, api_base=GEMINI_API_BASE,
+                      model=GEMINI_MODEL, rate_limiter=None, max_retries=5, timeout=GEMINI_TIMEOUT):
+    """
+    Grade several `(id, text)` submissions with one Gemini request asking for JSON.
+
+    Returns:
+        dict: {id: {grade, feedback}} for every submission that could be parsed
+        from the response; empty if the request or parsing failed
+    """
+    api_url = f"{api_base}/models/{model}:generateContent?key={api_key}"
+    headers = {"Content-Type": "application/json"}
+    prompt = build_batch_prompt(items, context, pdf_context_extract)
+    payload = {
+        "contents": [{
+            "parts": [{"text": prompt}]
+        }],
+        "generationConfig": {"responseMimeType": "application/json"}
+    }
+
+    print(f"Sending batch of {len(items)} submissions with prompt length: {len(prompt)}")
+    response = _post_with_retry(api_url, headers, payload, rate_limiter, max_retries, timeout=timeout)
+    if response.status_code != 200:
+        print(f"Error in Gemini batch call: {response.status_code}")
+        return {}
+    try:
+        return parse_batch_response(_candidate_text(response.json()) or "", [item_id for item_id, _ in items])
+    except ValueError as e:
+        print(f"Could not parse batch grading response: {str(e)}")
+        return {}
+
+def grade_texts_batched(texts, context, pdf_context_extract=None, api_key=None, token_budget=24000,
+                        max_batch_size=8, max_in_flight=4, on_result=None, stats=None, cache=None, **kwargs):
+    """
+    Grade several texts, packing them into shared prompts of up to `token_budget`
+    estimated tokens so the rubric and PDF context are sent once per batch.
+
+    Cached grades are used first. Batches are sent on a bounded thread pool, and
+    any text missing from a batch's JSON response (or a batch of one) is graded
+    with call_gemini_api_cached. Grades are cached under the same keys as single
+    calls. `stats`, when given, is updated with request and estimated token counts.
+    As with grade_texts_concurrently, `texts` may be a lazy sequence.
+
+    Returns:
+        list: One {grade, feedback} dict per text, in input order, or None where grading failed
+    """
+    if cache is None:
+        cache = api_cache
+    model = kwargs.get('model', GEMINI_MODEL)
+    results = [None] * len(texts)
+    counts = {'requests': 0, 'batch_requests': 0, 'fallback_requests': 0, 'estimated_prompt_tokens': 0}
+    lock = threading.Lock()
+
+    def count(**values):
+        with lock:
+            for field, value in values.items():
+                counts[field] += value
+
+    def finish(index, result):
+        results[index] = result
+        if on_result is not None:
+            on_result(index, result)
+
+    pending = []
+    for index, text in enumerate(texts):
+        cached = cache.get(grading_cache_key(text, context, pdf_context_extract, model))
+        if cached is not None:
+            finish(index, cached)
+        else:
+            pending.append(index)
+
+    def grade_single(index, text=None, fallback=False):
+        text = texts[index] if text is None else text
+        count(requests=1, fallback_requests=int(fallback),
+              estimated_prompt_tokens=estimate_tokens(build_grading_prompt(text, context, pdf_context_extract)))
+        return call_gemini_api_cached(text, context, pdf_context_extract, api_key, cache=cache, **kwargs)
+
+    def grade_batch(indexes):
+        if len(indexes) == 1:
+            return {indexes[0]: grade_single(indexes[0])}
+        items = [(str(index), texts[index]) for index in indexes]
+        count(requests=1, batch_requests=1,
+              estimated_prompt_tokens=estimate_tokens(build_batch_prompt(items, context, pdf_context_extract)))
+        parsed = call_gemini_batch(items, context, pdf_context_extract, api_key, **kwargs)
+        graded = {}
+        for index, (item_id, text) in zip(indexes, items):
+            result = parsed.get(item_id)
+            if result is None:
+                result = grade_single(index, text, fallback=True)
+            else:
+                cache.set(grading_cache_key(text, context, pdf_context_extract, model), result)
+            graded[index] = result
+        return graded
+
+    batches = pack_batches((texts[index] for index in pending), context, pdf_context_extract,
+                           token_budget, max_batch_size)
+    batches = [[pending[position] for position in batch] for batch in batches]
+    if batches:
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            futures = {executor.submit(grade_batch, batch): batch for batch in batches}
+            for future in as_completed(futures):
+                try:
+                    graded = future.result()
+                except Exception as e:
+                    print(f"Error grading batch {futures[future]}: {str(e)}")
+                    continue
+                for index, result in graded.items():
+                    finish(index, result)
+
+    print(f"Batch grading: {len(texts)} texts, {len(pending)} uncached, {counts['requests']} requests "
+          f"({counts['batch_requests']} batched, {counts['fallback_requests']} fallbacks), "
+          f"~{counts['estimated_prompt_tokens']} prompt tokens")
+    if stats is not None:
+        stats.update(counts)
+    return results
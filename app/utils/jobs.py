@@ -0,0 +1,218 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_STAGES = ('downloaded', 'extracted', 'scored', 'graded')
+
+
+class JobProgress:
+    """
+    Thread-safe per-stage counters for a processing run
+    """
+
+    def __init__(self, on_change=None):
+        self._lock = threading.Lock()
+        self.total = 0
+        self.counts = {stage: 0 for stage in JOB_STAGES}
+        self.on_change = on_change
+
+    def set_total(self, total):
+        with self._lock:
+            self.total = total
+        if self.on_change is not None:
+            self.on_change()
+
+    def add(self, stage, count=1):
+        with self._lock:
+            self.counts[stage] = self.counts.get(stage, 0) + count
+        if self.on_change is not None:
+            self.on_change()
+
+    def snapshot(self):
+        with self._lock:
+            return {'total': self.total, **self.counts}
+
+
+class Job:
+    """
+    A submitted processing job and its current state
+    """
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self.status = 'queued'
+        self.progress = JobProgress()
+        self.result = None
+        self.status_code = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'progress': self.progress.snapshot(),
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        Rebuild a read-only Job from a state file written by another worker
+        """
+        job = cls(state['job_id'])
+        for field in ('status', 'error', 'created_at', 'started_at', 'finished_at', 'result', 'status_code'):
+            setattr(job, field, state.get(field))
+        progress = dict(state.get('progress', {}))
+        job.progress.total = progress.pop('total', 0)
+        job.progress.counts.update(progress)
+        return job
+
+
+class HeavyJobLimiter:
+    """
+    Caps how many processing runs (OCR, scoring, grading) execute at once in
+    one worker process, whether they come from /process_assignments or /jobs
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_use = 0
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """
+        Wait up to `timeout` seconds (forever for None) for a slot; returns whether one was taken
+        """
+        if not self._semaphore.acquire(timeout=timeout):
+            return False
+        with self._lock:
+            self.in_use += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self.in_use -= 1
+        self._semaphore.release()
+
+
+class JobManager:
+    """
+    Runs processing jobs on a local worker pool and keeps their state in memory.
+
+    With a `state_folder`, each job's state (and result once finished) is also
+    written there as JSON, at most every `state_interval` seconds while it runs,
+    so any worker process of a multi-process server can answer status requests.
+    Finished jobs are forgotten `retention_seconds` after they complete.
+    """
+
+    def __init__(self, app, max_workers=2, retention_seconds=3600, state_folder=None, state_interval=1.0):
+        self.app = app
+        self.retention_seconds = retention_seconds
+        self.state_folder = state_folder
+        self.state_interval = state_interval
+        if state_folder:
+            os.makedirs(state_folder, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _state_path(self, job_id):
+        return os.path.join(self.state_folder, f"{job_id}.json")
+
+    def _save(self, job, force=False):
+        if not self.state_folder:
+            return
+        now = time.time()
+        if not force and now - getattr(job, 'saved_at', 0) < self.state_interval:
+            return
+        job.saved_at = now
+        state = job.to_dict()
+        if job.finished_at is not None:
+            state.update(result=job.result, status_code=job.status_code)
+        path = self._state_path(job.id)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(temp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Error saving state of job {job.id}: {str(e)}")
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue `func(*args, progress=..., **kwargs)` and return the new Job.
+        `func` must return a (body, status code) tuple and runs in an app context.
+        """
+        self._prune()
+        job = Job(uuid.uuid4().hex)
+        job.progress.on_change = lambda: self._save(job)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._save(job, force=True)
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        """
+        Return the Job with this id, from this process or from the shared state folder
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None or not self.state_folder:
+            return job
+        try:
+            with open(self._state_path(job_id)) as f:
+                return Job.from_state(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _run(self, job, func, args, kwargs):
+        job.status = 'running'
+        job.started_at = time.time()
+        self._save(job, force=True)
+        try:
+            with self.app.app_context():
+                job.result, job.status_code = func(*args, progress=job.progress, **kwargs)
+            if job.status_code == 200:
+                job.status = 'completed'
+            else:
+                job.status = 'failed'
+                job.error = job.result.get('error') if isinstance(job.result, dict) else None
+        except Exception as e:
+            print(f"Error running job {job.id}: {str(e)}")
+            job.status = 'failed'
+            job.error = str(e)
+            job.status_code = 500
+        finally:
+            job.finished_at = time.time()
+            self._save(job, force=True)
+
+    def _prune(self):
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.finished_at is not None and job.finished_at < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        if not self.state_folder:
+            return
+        # State files of jobs run by any worker
+        for name in os.listdir(self.state_folder):
+            path = os.path.join(self.state_folder, name)
+            try:
+                if name.endswith('.json') and os.stat(path).st_mtime < cutoff:
+                    os.unlink(path)
+            except OSError:
+                pass
@@ -0,0 +1,102 @@
+from collections import defaultdict
+import numpy as np
+
+
+def get_hashvalues(signature):
+    """
+    Return the raw hash values of a signature as a numpy array.
+    Accepts either a datasketch MinHash or a plain array of hash values.
+    """
+    return np.asarray(getattr(signature, 'hashvalues', signature))
+
+
+class BandedLSH:
+    """
+    Banded locality-sensitive hashing index over MinHash signatures.
+
+    Each signature is split into `bands` bands of `rows` hash values. Two
+    documents become candidates when at least one band matches exactly, which
+    happens with probability 1 - (1 - s^rows)^bands for Jaccard similarity s.
+    """
+
+    def __init__(self, bands, rows):
+        self.bands = bands
+        self.rows = rows
+        self.tables = [defaultdict(set) for _ in range(bands)]
+        self.keys = {}
+
+    def _band_keys(self, signature):
+        hashvalues = get_hashvalues(signature)
+        if len(hashvalues) < self.bands * self.rows:
+            raise ValueError(
+                f"Signature has {len(hashvalues)} hash values, "
+                f"need at least bands * rows = {self.bands * self.rows}"
+            )
+        return [
+            hashvalues[b * self.rows:(b + 1) * self.rows].tobytes()
+            for b in range(self.bands)
+        ]
+
+    def insert(self, key, signature):
+        """
+        Add a signature to the index under the given key
+        """
+        if key in self.keys:
+            self.remove(key)
+        band_keys = self._band_keys(signature)
+        for table, band_key in zip(self.tables, band_keys):
+            table[band_key].add(key)
+        self.keys[key] = band_keys
+
+    def remove(self, key):
+        """
+        Remove a key from the index, if present
+        """
+        band_keys = self.keys.pop(key, None)
+        if band_keys is None:
+            return
+        for table, band_key in zip(self.tables, band_keys):
+            bucket = table.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del table[band_key]
+
+    def query(self, signature):
+        """
+        Return the set of keys sharing at least one band with the signature
+        """
+        candidates = set()
+        for table, band_key in zip(self.tables, self._band_keys(signature)):
+            candidates.update(table.get(band_key, ()))
+        return candidates
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+
+def signature_jaccard(sig_a, sig_b):
+    """
+    Estimate Jaccard similarity as the fraction of equal hash values
+    """
+    a = get_hashvalues(sig_a)
+    b = get_hashvalues(sig_b)
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+def signature_jaccard_matrix(signatures, chunk_size=256):
+    """
+    Estimate pairwise Jaccard similarity for a `(n_docs, num_perm)` signature matrix.
+    Rows are compared in chunks so memory stays at chunk_size * n_docs * num_perm booleans.
+    """
+    signatures = np.asarray(signatures)
+    n, num_perm = signatures.shape
+    similarity = np.empty((n, n), dtype=np.float64)
+    for start in range(0, n, chunk_size):
+        block = signatures[start:start + chunk_size, np.newaxis, :]
+        matches = np.count_nonzero(block == signatures[np.newaxis, :, :], axis=2)
+        similarity[start:start + chunk_size] = matches / num_perm
+    return similarity
@@ -0,0 +1,243 @@
+import mmap
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Upper bounds (seconds) for stage and run latency histograms
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def peak_rss_bytes(children=False):
+    """
+    Return the peak resident set size of this process (or of its reaped
+    children, such as pdftotext runs) in bytes, or None where getrusage is
+    unavailable
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def current_rss_bytes(pid='self'):
+    """
+    Return the current resident set size of a process (this one by default)
+    in bytes, or None where /proc is unavailable
+    """
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * mmap.PAGESIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters, gauges and histograms for one app process, rendered
+    in the Prometheus text exposition format by `render()`.
+
+    Metric names are prefixed with `namespace`. Every process keeps its own
+    registry, so under several server workers each scrape sees one worker.
+    """
+
+    def __init__(self, namespace='grader', buckets=DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _series(self, kind, name, help_text, labels):
+        name = f"{self.namespace}_{name}"
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = {'kind': kind, 'help': help_text or name, 'series': {}}
+        elif metric['kind'] != kind:
+            raise ValueError(f"Metric {name} is a {metric['kind']}, not a {kind}")
+        return metric['series'], tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, help_text=None, **labels):
+        """
+        Add `value` to a counter
+        """
+        with self._lock:
+            series, key = self._series('counter', name, help_text, labels)
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name, value, help_text=None, **labels):
+        """
+        Set a gauge to `value`
+        """
+        with self._lock:
+            series, key = self._series('gauge', name, help_text, labels)
+            series[key] = value
+
+    def observe(self, name, value, help_text=None, **labels):
+        """
+        Record one observation in a histogram
+        """
+        with self._lock:
+            series, key = self._series('histogram', name, help_text, labels)
+            state = series.get(key)
+            if state is None:
+                state = series[key] = {'buckets': [0] * len(self.buckets), 'count': 0, 'sum': 0.0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][i] += 1
+            state['count'] += 1
+            state['sum'] += value
+
+    def render(self):
+        """
+        Return every metric in the Prometheus text format (version 0.0.4)
+        """
+        if resource is not None:
+            self.set('peak_rss_bytes', peak_rss_bytes(), 'Peak resident set size', process='self')
+            self.set('peak_rss_bytes', peak_rss_bytes(children=True), 'Peak resident set size',
+                     process='children')
+        rss = current_rss_bytes()
+        if rss is not None:
+            self.set('rss_bytes', rss, 'Current resident set size')
+
+        lines = []
+        with self._lock:
+            for name in sorted(self._metrics):
+                metric = self._metrics[name]
+                lines.append(f"# HELP {name} {metric['help']}")
+                lines.append(f"# TYPE {name} {metric['kind']}")
+                for labels, value in sorted(metric['series'].items()):
+                    if metric['kind'] != 'histogram':
+                        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                        continue
+                    # Buckets are stored per bound, which is already cumulative
+                    for bound, count in zip(self.buckets + (float('inf'),), value['buckets'] + [value['count']]):
+                        bucket_labels = labels + (('le', _format_value(float(bound))),)
+                        lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value['sum'])}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+        return '\n'.join(lines) + '\n'
+
+
+class RunMetrics:
+    """
+    Timings and counters for a single processing run.
+
+    Stage times are wall-clock seconds for sequential stages; for pipeline
+    stages that run on several threads they are busy seconds summed across
+    workers. Everything is also forwarded to the process-wide `registry`.
+    """
+
+    def __init__(self, registry=None):
+        self.registry = registry
+        self.started = time.perf_counter()
+        self.rss_start = current_rss_bytes()
+        self.stages = {}
+        self.documents = []
+        self.caches = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def add_stage(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+        if self.registry is not None:
+            self.registry.observe('stage_seconds', seconds, 'Stage time per run (per document for pipeline stages)',
+                                  stage=name)
+
+    def cache_result(self, cache, hit, count=1):
+        result = 'hit' if hit else 'miss'
+        with self._lock:
+            counts = self.caches.setdefault(cache, {'hits': 0, 'misses': 0})
+            counts['hits' if hit else 'misses'] += count
+        if self.registry is not None and count:
+            self.registry.inc('cache_requests_total', count, 'Cache lookups by cache and result',
+                              cache=cache, result=result)
+
+    def count(self, name, value=1, help_text=None):
+        """
+        Add `value` to a named run counter (exported as `<name>_total`)
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        if self.registry is not None and value:
+            self.registry.inc(f'{name}_total', value, help_text)
+
+    def add_document(self, document):
+        """
+        Record per-document counters: bytes, pages, native_pages, ocr_pages,
+        chars, ocr_seconds and per-stage seconds
+        """
+        with self._lock:
+            self.documents.append(document)
+        if self.registry is None:
+            return
+        registry = self.registry
+        if 'failed_stage' in document:
+            source = 'failed'
+        else:
+            source = 'cache' if document.get('cache_hit') else 'extracted'
+        registry.inc('documents_total', 1, 'Submissions run through extraction', source=source)
+        registry.inc('document_bytes_total', document.get('bytes', 0), 'PDF bytes downloaded')
+        registry.inc('document_chars_total', document.get('chars', 0), 'Characters of extracted text')
+        registry.inc('document_pages_total', document.get('native_pages', 0), 'Pages extracted', source='native')
+        registry.inc('document_pages_total', document.get('ocr_pages', 0), 'Pages extracted', source='ocr')
+        registry.inc('ocr_blank_pages_total', document.get('blank_pages', 0), 'OCR pages skipped as blank')
+        registry.inc('ocr_reocr_pages_total', document.get('reocr_pages', 0), 'Pages OCR\'d again at a higher DPI')
+        registry.inc('ocr_seconds_total', document.get('ocr_seconds', 0.0), 'Seconds spent in OCR')
+
+    def finish(self, status):
+        """
+        Close the run and return its `timings` summary
+        """
+        total = time.perf_counter() - self.started
+        if self.registry is not None:
+            self.registry.observe('run_seconds', total, 'End-to-end processing run time')
+            self.registry.inc('runs_total', 1, 'Processing runs by HTTP status', status=status)
+        with self._lock:
+            return {
+                'total_seconds': round(total, 3),
+                'stages': {name: round(seconds, 3) for name, seconds in self.stages.items()},
+                'caches': {name: dict(counts) for name, counts in self.caches.items()},
+                'counters': dict(self.counters),
+                'documents': [
+                    {
+                        field: round(value, 3) if isinstance(value, float) else value
+                        for field, value in document.items()
+                    }
+                    for document in self.documents
+                ],
+                'rss_start_bytes': self.rss_start,
+                'rss_end_bytes': current_rss_bytes(),
+                'peak_rss_bytes': peak_rss_bytes(),
+                'peak_children_rss_bytes': peak_rss_bytes(children=True)
+            }
@@ -0,0 +1,74 @@
+import queue
+import threading
+
+_DONE = object()
+
+
+def run_pipeline(items, stages, queue_size=4):
+    """
+    Run items through a chain of stages connected by bounded queues.
+
+    Each stage is a `(name, func, workers)` tuple; `func` receives the output of
+    the previous stage and returns the value for the next one, or None to drop
+    the item. Stages run concurrently in their own worker threads, so work on
+    different items overlaps, and the bounded queues apply backpressure when a
+    later stage falls behind. Exceptions are logged and the item is dropped.
+
+    Yields:
+        The output of the last stage for every item that made it through,
+        in completion order
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+
+    def feed():
+        try:
+            for item in items:
+                queues[0].put(item)
+        finally:
+            for _ in range(stages[0][2]):
+                queues[0].put(_DONE)
+
+    def make_worker(index):
+        name, func, _ = stages[index]
+        inbox, outbox = queues[index], queues[index + 1]
+        next_workers = stages[index + 1][2] if index + 1 < len(stages) else 1
+
+        def work():
+            while True:
+                item = inbox.get()
+                if item is _DONE:
+                    break
+                try:
+                    result = func(item)
+                except Exception as e:
+                    print(f"Error in {name} stage: {str(e)}")
+                    continue
+                if result is not None:
+                    outbox.put(result)
+
+            with remaining_lock:
+                remaining[index] -= 1
+                last = remaining[index] == 0
+            if last:
+                for _ in range(next_workers):
+                    outbox.put(_DONE)
+
+        return work
+
+    remaining = [workers for _, _, workers in stages]
+    remaining_lock = threading.Lock()
+
+    threads = [threading.Thread(target=feed, daemon=True)]
+    for index, (_, _, workers) in enumerate(stages):
+        threads.extend(threading.Thread(target=make_worker(index), daemon=True) for _ in range(workers))
+    for thread in threads:
+        thread.start()
+
+    while True:
+        result = queues[-1].get()
+        if result is _DONE:
+            break
+        yield result
+
+    for thread in threads:
+        thread.join()
@@ -1,25 +1,55 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from scipy.sparse import coo_matrix, csr_matrix, vstack
+from scipy.sparse.csgraph import connected_components
 
-def calculate_plagiarism_scores(minhash_dict, assignment_text):
+from app.utils.lsh import BandedLSH, get_hashvalues, signature_jaccard, signature_jaccard_matrix
+
+def brute_force_plagiarism_scores(minhash_dict, assignment_text):
     """
-    Calculate plagiarism scores for all documents using MinHash Jaccard similarity
+    Calculate plagiarism scores by comparing every document with every other one.
+    Quadratic in the number of documents; kept as the baseline for measuring LSH recall.
     """
-    plagiarism_scores = {}
     keys = list(assignment_text.keys())
-    n = len(keys)
+    if not keys:
+        return {}
+    signatures = np.vstack([get_hashvalues(minhash_dict[key]) for key in keys])
+    similarity = signature_jaccard_matrix(signatures)
+    np.fill_diagonal(similarity, 0.0)
+    max_sims = similarity.max(axis=1)
+
+    # convert to percentage
+    return {key: float(max_sim) * 100 for key, max_sim in zip(keys, max_sims)}
 
-    for i in range(n):
-        key = keys[i]
+def calculate_plagiarism_scores(minhash_dict, assignment_text, bands=64, rows=2, matches=None):
+    """
+    Calculate plagiarism scores for all documents using MinHash Jaccard similarity.
+
+    Candidate pairs are found with a banded LSH index (`bands` x `rows` hash values
+    per signature) and only those candidates are re-checked with the exact MinHash
+    estimate, so the cost grows with the number of similar pairs rather than n^2.
+    Documents without any candidate get a score of 0. If a `matches` dict is
+    given, it is filled with each document's most similar document (or None).
+    """
+    keys = list(assignment_text.keys())
+    index = BandedLSH(bands, rows)
+    for key in keys:
+        index.insert(key, minhash_dict[key])
+
+    plagiarism_scores = {}
+    for key in keys:
         max_sim = 0.0
-        for j in range(n):
-            if i == j:
+        best = None
+        for other_key in index.query(minhash_dict[key]):
+            if other_key == key:
                 continue
-            other_key= keys[j]
-            sim = minhash_dict[key].jaccard(minhash_dict[other_key])
+            sim = signature_jaccard(minhash_dict[key], minhash_dict[other_key])
             if sim > max_sim:
                 max_sim = sim
+                best = other_key
         plagiarism_scores[key] = max_sim * 100  # convert to percentage
+        if matches is not None:
+            matches[key] = best
 
     print("\nPlagiarism scores (maximum similarity in %):")
     for fname, score in plagiarism_scores.items():
@@ -27,28 +57,189 @@ def calculate_plagiarism_scores(minhash_dict, assignment_text):
         
     return plagiarism_scores
 
-def group_similar_assignments(selected_texts, selected_files, group_threshold):
+def update_plagiarism_scores(minhash_dict, previous, bands=64, rows=2, matches=None):
     """
-    Group similar assignments based on cosine similarity
+    Patch the plagiarism scores of an earlier run after some documents changed.
+
+    `minhash_dict` holds the signatures of every current document and `previous`
+    maps each unchanged document to its earlier (score, best match) pair.
+    Documents missing from `previous` are new or changed: they are looked up in
+    the banded LSH index, and every candidate they hit has its stored maximum
+    raised if the new pair beats it. An unchanged document whose best match
+    changed or was removed is looked up again, since its maximum may have
+    dropped. Only those documents are queried, so a resubmission of a few files
+    costs a few lookups instead of a full recompute; the scores equal what
+    calculate_plagiarism_scores returns for the whole class.
     """
-    # Vectorize the texts using TF-IDF
-    vectorizer = TfidfVectorizer(stop_words='english')
-    tfidf_matrix = vectorizer.fit_transform(selected_texts)
-    cos_sim = cosine_similarity(tfidf_matrix)
+    index = BandedLSH(bands, rows)
+    for key, signature in minhash_dict.items():
+        index.insert(key, signature)
+
+    changed = [key for key in minhash_dict if key not in previous]
+    stale = [
+        key for key, (_, match) in previous.items()
+        if key in minhash_dict and match is not None and match not in previous
+    ]
+    best = {key: previous[key] for key in minhash_dict if key in previous}
+    for key in changed + stale:
+        best[key] = (0.0, None)
+
+    def compare(key, update_other):
+        for other_key in index.query(minhash_dict[key]):
+            if other_key == key:
+                continue
+            sim = signature_jaccard(minhash_dict[key], minhash_dict[other_key]) * 100
+            if sim > best[key][0]:
+                best[key] = (sim, other_key)
+            if update_other and sim > best[other_key][0]:
+                best[other_key] = (sim, key)
+
+    for key in stale:
+        compare(key, update_other=False)
+    for key in changed:
+        compare(key, update_other=True)
+
+    print(f"\nPlagiarism scores patched: {len(changed)} new or changed, {len(stale)} re-checked, "
+          f"{len(best) - len(changed) - len(stale)} kept")
+    for key in changed:
+        print(f"{key}: {round(best[key][0], 2)}%")
+
+    if matches is not None:
+        matches.update((key, match) for key, (_, match) in best.items())
+    return {key: score for key, (score, _) in best.items()}
+
+def corpus_key(namespace, key):
+    """
+    Archive key (or owner submission id) for a key of one run. Classroom
+    submission ids, and so run keys, are only unique within one courseWork,
+    so they are prefixed with the course assignment when it is known.
+    """
+    return f"{namespace}/{key}" if namespace else key
+
+def _corpus_owner(submission, namespace):
+    owner = {'submission': corpus_key(namespace, submission) if submission is not None else None,
+             'assignment': namespace}
+    return {field: value for field, value in owner.items() if value is not None}
+
+def score_against_corpus(minhash_dict, corpus, plagiarism_scores, submissions=None, namespace=None):
+    """
+    Raise plagiarism scores to the best match in a SignatureCorpus of earlier submissions.
+
+    Documents in the current run are left out of the lookup (they were already
+    compared with each other). `submissions` maps keys to submission ids and
+    `namespace` is the course assignment (see add_to_corpus); archived rows
+    from the same submissions or the same assignment are left out too, so a
+    student's earlier draft (even under another file name) or a removed
+    classmate never counts. Returns the archive-only scores in percent.
+    """
+    corpus.refresh()
+    current_keys = {corpus_key(namespace, key) for key in minhash_dict}
+    submissions = submissions or {}
+    excluded_submissions = {
+        corpus_key(namespace, submission) for submission in submissions.values() if submission is not None
+    }
+    archive_scores = {}
+    for key, signature in minhash_dict.items():
+        matches = corpus.query(
+            signature,
+            exclude=current_keys,
+            exclude_submissions=excluded_submissions,
+            exclude_assignment=namespace
+        )
+        archive_scores[key] = matches[0][1] * 100 if matches else 0.0
+        if archive_scores[key] > plagiarism_scores.get(key, 0.0):
+            print(f"{key}: {round(archive_scores[key], 2)}% similar to archived submission {matches[0][0]}")
+            plagiarism_scores[key] = archive_scores[key]
+    return archive_scores
+
+def add_to_corpus(corpus, minhash_dict, keys, submissions=None, namespace=None):
+    """
+    Archive the signatures of `keys` under their namespaced keys, owned by
+    their submission (from `submissions`) and the `namespace` assignment
+    """
+    submissions = submissions or {}
+    corpus.insert_many(
+        ((corpus_key(namespace, key), minhash_dict[key]) for key in keys),
+        {corpus_key(namespace, key): _corpus_owner(submissions.get(key), namespace) for key in keys}
+    )
+
+def lsh_recall(minhash_dict, assignment_text, plagiarism_scores, threshold):
+    """
+    Compare LSH plagiarism scores against the brute-force baseline.
+
+    Returns the fraction of documents whose brute-force score is at or above
+    `threshold` (a percentage) for which the LSH score matches exactly, along
+    with the number of such documents. Recall is 1.0 when there are none.
+    """
+    baseline = brute_force_plagiarism_scores(minhash_dict, assignment_text)
+    flagged = [key for key, score in baseline.items() if score >= threshold]
+    if not flagged:
+        return {'recall': 1.0, 'flagged': 0}
+    found = sum(1 for key in flagged if abs(plagiarism_scores.get(key, 0.0) - baseline[key]) < 1e-9)
+    return {'recall': found / len(flagged), 'flagged': len(flagged)}
+
+def tfidf_from_stream(texts, batch_size=64, n_features=2 ** 20):
+    """
+    Build an L2-normalised TF-IDF matrix from an iterable of texts.
+
+    Texts are hashed into term counts `batch_size` at a time with a stateless
+    HashingVectorizer, so only one batch of raw text is in memory; IDF weights
+    are fitted on the stacked sparse counts afterwards. Weights are float32 and
+    reweighted in place, so the matrix is the only per-document state kept.
+    """
+    vectorizer = HashingVectorizer(stop_words='english', n_features=n_features, alternate_sign=False, norm=None,
+                                   dtype=np.float32)
+    blocks = []
+    batch = []
+    for text in texts:
+        batch.append(text)
+        if len(batch) == batch_size:
+            blocks.append(vectorizer.transform(batch))
+            batch = []
+    if batch:
+        blocks.append(vectorizer.transform(batch))
+    if not blocks:
+        return csr_matrix((0, n_features), dtype=np.float32)
+    counts = vstack(blocks, format='csr')
+    del blocks
+    return TfidfTransformer().fit(counts).transform(counts, copy=False)
+
+def group_similar_assignments(selected_texts, selected_files, group_threshold, chunk_size=256):
+    """
+    Group similar assignments based on cosine similarity.
+
+    `selected_texts` may be any iterable (for example texts streamed from a
+    TextStore); it is read once through tfidf_from_stream.
+    TF-IDF rows are L2-normalised, so cosine similarity is a sparse dot product.
+    Rows are multiplied against the matrix in chunks of `chunk_size` and only
+    pairs at or above `group_threshold` are kept, so memory grows with the number
+    of similar pairs instead of n^2. Groups are the connected components of the
+    resulting similarity graph, ordered by their first member.
+    """
+    tfidf_matrix = tfidf_from_stream(selected_texts)
+    n = tfidf_matrix.shape[0]
+
+    rows, cols = [], []
+    for start in range(0, n, chunk_size):
+        block = (tfidf_matrix[start:start + chunk_size] @ tfidf_matrix.T).tocoo()
+        block_rows = block.row + start
+        keep = (block.data >= group_threshold) & (block_rows < block.col)
+        rows.append(block_rows[keep])
+        cols.append(block.col[keep])
+        del block
+
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+    cols = np.concatenate(cols) if cols else np.empty(0, dtype=np.int64)
+    graph = coo_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
 
     groups = []  # list of groups, each group is a list of indices
-    visited = set()
-
-    for i in range(len(selected_files)):
-        if i in visited:
-            continue
-        current_group = [i]
-        visited.add(i)
-        for j in range(i + 1, len(selected_files)):
-            if j not in visited and cos_sim[i, j] >= group_threshold:
-                current_group.append(j)
-                visited.add(j)
-        groups.append(current_group)
+    group_for_label = {}
+    for i, label in enumerate(labels):
+        if label not in group_for_label:
+            group_for_label[label] = []
+            groups.append(group_for_label[label])
+        group_for_label[label].append(i)
 
     print("\nGrading groups (by indices):")
     for idx, group in enumerate(groups):
@@ -0,0 +1,601 @@
+import os
+import shutil
+import tempfile
+import time
+from functools import partial
+import numpy as np
+from flask import current_app
+
+from app.utils.file_handler import extract_text_from_pdf_with_stats
+from app.utils.text_analysis import get_shingle_hashes, signatures_from_shingle_hashes
+from app.utils.extraction_cache import ExtractionCache, settings_version
+from app.utils.course_state import course_state_key, is_unchanged
+from app.utils.drive import create_drive_session, download_drive_file
+from app.utils.pipeline import run_pipeline
+from app.utils.plagiarism import (
+    add_to_corpus,
+    calculate_plagiarism_scores,
+    group_similar_assignments,
+    score_against_corpus,
+    update_plagiarism_scores
+)
+from app.utils.grading import grade_texts_batched, grade_texts_concurrently
+from app.utils.jobs import JobProgress
+from app.utils.metrics import RunMetrics
+from app.utils.text_store import TextStore
+
+
+def get_ocr_options():
+    """
+    Return the adaptive OCR options for extract_text_from_pdf_with_stats,
+    or None when OCR_MODE is 'fixed'
+    """
+    config = current_app.config
+    if config['OCR_MODE'] != 'adaptive':
+        return None
+    return {
+        'probe_dpi': config['OCR_PROBE_DPI'],
+        'min_dpi': config['OCR_MIN_DPI'],
+        'max_dpi': config['OCR_MAX_DPI'],
+        'min_confidence': config['OCR_MIN_CONFIDENCE'],
+        'blank_ink_ratio': config['OCR_BLANK_INK_RATIO']
+    }
+
+def get_extraction_cache():
+    """
+    Build the extraction cache for the current app configuration.
+    The version stamp covers every setting that changes extracted text or signatures.
+    """
+    config = current_app.config
+    version = settings_version(
+        ocr_dpi=config['OCR_DPI'],
+        ocr_options=get_ocr_options(),
+        native_text_min_chars=config['NATIVE_TEXT_MIN_CHARS'],
+        native_text_max_image_coverage=config['NATIVE_TEXT_MAX_IMAGE_COVERAGE'],
+        shingle_size=config['SHINGLE_SIZE'],
+        num_perm=config['MINHASH_NUM_PERM']
+    )
+    return ExtractionCache(config['EXTRACTION_CACHE_FOLDER'], config['EXTRACTION_CACHE_MAX_BYTES'], version)
+
+def get_course_state_version(description, max_score, pdf_context):
+    """
+    Version stamp for stored course state: everything the stored signatures,
+    scores and grades depend on besides the submissions themselves
+    """
+    config = current_app.config
+    return settings_version(
+        extraction=get_extraction_cache().version,
+        lsh_bands=config['LSH_BANDS'],
+        lsh_rows=config['LSH_ROWS'],
+        corpus=config['CORPUS_ENABLED'],
+        model=config['GEMINI_MODEL'],
+        description=description,
+        max_score=max_score,
+        pdf_context=pdf_context
+    )
+
+def process_submissions(data, access_token, progress=None, include_timings=False, slot_timeout=None, full_run=False):
+    """
+    Download, extract, score and grade the submissions in a courseWork payload.
+
+    Must run inside an application context. Per-stage counts are reported on
+    `progress` (a JobProgress) as submissions move through the run, and stage
+    timings, per-document counters and cache hit rates go to the app's metrics
+    registry. With `include_timings` the body also carries a `timings` block.
+    Extracted texts are kept in a per-run TextStore on disk rather than in memory.
+
+    When the payload identifies its course assignment, the run is incremental
+    against the course state of the previous run: unchanged submissions are not
+    downloaded, OCR'd or graded again and their plagiarism scores are patched
+    rather than recomputed. `full_run` ignores the stored state (and replaces it).
+
+    The run holds one of the worker's heavy-job slots; if none frees up within
+    `slot_timeout` seconds (None waits indefinitely) it answers 503.
+
+    Returns:
+        tuple: (response body dict, HTTP status code)
+    """
+    limiter = current_app.extensions.get('heavy_jobs')
+    if limiter is not None and not limiter.acquire(slot_timeout):
+        return {'error': 'Server is busy processing other submissions, retry later'}, 503
+    try:
+        return _run_with_metrics(data, access_token, progress, include_timings, full_run)
+    finally:
+        if limiter is not None:
+            limiter.release()
+
+def _run_with_metrics(data, access_token, progress, include_timings, full_run):
+    run = RunMetrics(current_app.extensions.get('metrics'))
+    try:
+        with TextStore(current_app.config['TEXT_STORE_FOLDER']) as text_store:
+            body, status = _process_submissions(
+                data, access_token, progress or JobProgress(), run, text_store, full_run
+            )
+    except Exception:
+        run.finish(500)
+        raise
+
+    timings = run.finish(status)
+    print(f"Run finished in {timings['total_seconds']:.2f}s: " +
+          ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings['stages'].items()))
+    if include_timings:
+        body['timings'] = timings
+    return body, status
+
+def _process_submissions(data, access_token, progress, run, text_store, full_run=False):
+    assignmentDescription = "Title description"
+    assignmentTitle = "title"
+    MAX_SCORE = 100
+
+    try:
+        assignmentInfo = data.get('assignmentInfo')
+        if assignmentInfo:
+            assignmentTitle = assignmentInfo.get('title', 'Untitled')
+            assignmentDescription = assignmentInfo.get('description', '')
+            MAX_SCORE = assignmentInfo.get('maxPoints', 100)
+    except Exception as e:
+        print(f"Error parsing assignment info: {str(e)}")
+
+    print("description", assignmentDescription)
+
+    submissions = data['courseWork']
+    print(f"Received {len(submissions)} submissions to process")
+
+    context_folder = current_app.config['CONTEXT_FOLDER']
+    submissions_path = current_app.config['SUBMISSIONS_FOLDER']
+
+    pdf_context_extract = assignmentDescription  # Add your PDF context if needed
+    assignments_text = {}
+    extraction_stats = {
+        'pages': 0, 'native_pages': 0, 'ocr_pages': 0, 'blank_pages': 0, 'reocr_pages': 0,
+        'native_seconds': 0.0, 'ocr_seconds': 0.0
+    }
+    extraction_cache = get_extraction_cache()
+    ocr_options = get_ocr_options()
+    ocr_pool = current_app.extensions.get('ocr_pool')
+    minhash_dict = {}
+
+    # Collect PDF attachments first so they can be streamed through the pipeline
+    attachments = []
+    for submission in submissions:
+        try:
+            if 'assignmentSubmission' in submission and 'attachments' in submission['assignmentSubmission']:
+                for attachment in submission['assignmentSubmission']['attachments']:
+                    try:
+                        if 'driveFile' in attachment:
+                            drive_file = attachment['driveFile']
+                            file_name = drive_file.get('title')
+                            if isinstance(file_name, str) and file_name.lower().endswith('.pdf'):
+                                attachments.append({
+                                    'index': len(attachments),
+                                    'key': f"{submission['id']}_{file_name}",
+                                    'submission_id': submission['id'],
+                                    'user_id': submission['userId'],
+                                    'file_id': drive_file['id'],
+                                    'file_name': file_name,
+                                    'update_time': submission.get('updateTime')
+                                })
+                    except Exception as e:
+                        print(f"Error processing attachment: {str(e)}")
+        except Exception as e:
+            print(f"Error processing submission: {str(e)}")
+    progress.set_total(len(attachments))
+
+    # Attachments whose Drive file and submission update time match the course
+    # state of the last run are not downloaded again
+    assignment_key = course_state_key(data)
+    state_store = current_app.extensions.get('course_state')
+    state_key = assignment_key if state_store is not None else None
+    state_version = get_course_state_version(assignmentDescription, MAX_SCORE, pdf_context_extract)
+    previous = state_store.load(state_key, state_version) if state_key is not None and not full_run else {}
+    reused = []
+    pending = []
+    for record in attachments:
+        entry = previous.get(record['key'])
+        if entry is not None and is_unchanged(entry, record):
+            record['reused'] = True
+            reused.append(record)
+        else:
+            pending.append(record)
+    if previous:
+        print(f"Course state for {state_key}: {len(reused)} of {len(attachments)} attachments unchanged")
+    progress.add('downloaded', len(reused))
+    progress.add('extracted', len(reused))
+
+    config = current_app.config
+
+    def advance(record, stage):
+        # Reused attachments were counted up front; don't count them twice if they are fetched after all
+        if not record.get('reused'):
+            progress.add(stage)
+
+    def download_stage(session, record):
+        fd, temp_path = tempfile.mkstemp(suffix='.pdf')
+        os.close(fd)
+        digest = download_drive_file(
+            session,
+            record['file_id'],
+            access_token,
+            temp_path,
+            base_url=config['DRIVE_API_BASE'],
+            chunk_size=config['DOWNLOAD_CHUNK_SIZE']
+        )
+        if digest is None:
+            print(f"Could not download file: {record['file_name']}")
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            return None
+        record['temp_path'] = temp_path
+        record['digest'] = digest
+        record['bytes'] = os.path.getsize(temp_path)
+        advance(record, 'downloaded')
+        return record
+
+    def extract_stage(record):
+        file_name = record['file_name']
+        try:
+            safe_filename = file_name.replace(" ", "_")
+            save_path = os.path.join(submissions_path, safe_filename)
+            shutil.copyfile(record['temp_path'], save_path)
+            print(f"File saved permanently at: {save_path}")
+
+            cached = extraction_cache.get(record['digest'])
+            run.cache_result('extraction', cached is not None)
+            if cached is not None:
+                print(f"Extraction cache hit for {file_name}")
+                record['text'] = cached['text']
+                record['signature'] = cached['signature']
+                record['cache_hit'] = True
+                advance(record, 'extracted')
+                return record
+
+            try:
+                extracted_text, record['stats'] = extract_text_from_pdf_with_stats(
+                    record['temp_path'],
+                    dpi=config['OCR_DPI'],
+                    workers=config['OCR_WORKERS'],
+                    pages_per_task=config['OCR_PAGES_PER_TASK'],
+                    native_min_chars=config['NATIVE_TEXT_MIN_CHARS'],
+                    ocr_options=ocr_options,
+                    pool=ocr_pool,
+                    native_max_image_coverage=config['NATIVE_TEXT_MAX_IMAGE_COVERAGE']
+                )
+            except Exception as e:
+                print(f"Error extracting text from {file_name}: {str(e)}")
+                return None
+            if not extracted_text:
+                print(f"Warning: No text extracted from {file_name}")
+                return None
+            record['text'] = extracted_text
+            advance(record, 'extracted')
+            return record
+        finally:
+            os.unlink(record['temp_path'])
+
+    def sign_stage(record):
+        if 'signature' not in record:
+            shingles = get_shingle_hashes(record['text'], config['SHINGLE_SIZE'])
+            record['signature'] = signatures_from_shingle_hashes([shingles], config['MINHASH_NUM_PERM'])[0]
+            try:
+                extraction_cache.put(record['digest'], record['text'], shingles, record['signature'])
+            except Exception as e:
+                print(f"Error caching extraction for {record['file_name']}: {str(e)}")
+        # Spill the text to disk so only records still in the pipeline hold one
+        text = record.pop('text')
+        text_store.put(record['index'], text)
+        record['chars'] = len(text)
+        return record
+
+    def timed(name, stage):
+        # Per-document busy time for a pipeline stage; a stage that drops the
+        # record (returns None or raises) is recorded as where it failed
+        def run_stage(record):
+            start = time.perf_counter()
+            result = None
+            try:
+                result = stage(record)
+                return result
+            finally:
+                seconds = time.perf_counter() - start
+                record[f'{name}_seconds'] = seconds
+                run.add_stage(name, seconds)
+                if result is None:
+                    record['failed_stage'] = name
+        return run_stage
+
+    def extract_records(batch):
+        # Downloads, OCR and signing overlap across submissions; bounded queues cap memory
+        if not batch:
+            return []
+        session = create_drive_session(
+            max_connections=config['DOWNLOAD_WORKERS'],
+            retries=config['DOWNLOAD_RETRIES'],
+            backoff_factor=config['DOWNLOAD_BACKOFF_FACTOR']
+        )
+        try:
+            with run.stage('pipeline'):
+                records = list(run_pipeline(
+                    batch,
+                    [
+                        ('download', timed('download', partial(download_stage, session)), config['DOWNLOAD_WORKERS']),
+                        ('extract', timed('extract', extract_stage), config['EXTRACT_WORKERS']),
+                        ('sign', timed('sign', sign_stage), config['SIGN_WORKERS'])
+                    ],
+                    queue_size=config['PIPELINE_QUEUE_SIZE']
+                ))
+        finally:
+            session.close()
+
+        for record in batch:
+            document = {
+                'file_name': record['file_name'],
+                'cache_hit': record.get('cache_hit', False),
+                'bytes': record.get('bytes', 0),
+                'chars': record.get('chars', 0)
+            }
+            document.update(record.get('stats', {}))
+            for field in ('download_seconds', 'extract_seconds', 'sign_seconds', 'failed_stage'):
+                if field in record:
+                    document[field] = record[field]
+            run.add_document(document)
+        for record in records:
+            for field, value in record.get('stats', {}).items():
+                extraction_stats[field] += value
+        return records
+
+    records = extract_records(pending)
+
+    # Unchanged submissions are the skipped ones and those downloaded again with the same content
+    unchanged = set()
+    for record in sorted(records + reused, key=lambda r: r['index']):
+        key = record['key']
+        entry = previous.get(key)
+        if record.get('reused'):
+            record['digest'] = entry['digest']
+            record['signature'] = entry['signature']
+        if entry is not None and entry['digest'] == record['digest']:
+            unchanged.add(key)
+        assignments_text[key] = {
+            'text_key': None if record.get('reused') else record['index'],
+            'submission_id': record['submission_id'],
+            'user_id': record['user_id'],
+            'file_name': record['file_name'],
+            'file_id': record['file_id'],
+            'update_time': record['update_time'],
+            'digest': record['digest']
+        }
+        minhash_dict[key] = record['signature']
+    changed = [key for key in minhash_dict if key not in unchanged]
+
+    print("Text extraction completed.")
+    print(f"Extraction stats: {extraction_stats['native_pages']} native pages in "
+          f"{extraction_stats['native_seconds']:.2f}s, {extraction_stats['ocr_pages']} OCR'd pages in "
+          f"{extraction_stats['ocr_seconds']:.2f}s")
+
+    # Plagiarism detection; with course state only new and changed submissions are compared
+    try:
+        course_matches = {}
+        with run.stage('plagiarism'):
+            if unchanged:
+                course_scores = update_plagiarism_scores(
+                    minhash_dict,
+                    {key: (previous[key]['course_score'], previous[key]['course_match']) for key in unchanged},
+                    bands=current_app.config['LSH_BANDS'],
+                    rows=current_app.config['LSH_ROWS'],
+                    matches=course_matches
+                )
+            else:
+                course_scores = calculate_plagiarism_scores(
+                    minhash_dict,
+                    assignments_text,
+                    bands=current_app.config['LSH_BANDS'],
+                    rows=current_app.config['LSH_ROWS'],
+                    matches=course_matches
+                )
+        plagiarism_scores = dict(course_scores)
+
+        # Cross-term check of every submission against the archive (other assignments
+        # may have added to it since the last run), then add the new and changed ones
+        if current_app.config['CORPUS_ENABLED']:
+            corpus = current_app.extensions['signature_corpus']
+            # Archived rows of the same submissions or assignment are never matches;
+            # archive keys are prefixed with the assignment, as submission ids repeat across courses
+            submissions = {key: item['submission_id'] for key, item in assignments_text.items()}
+            with run.stage('corpus'):
+                score_against_corpus(minhash_dict, corpus, plagiarism_scores, submissions, assignment_key)
+                add_to_corpus(corpus, minhash_dict, changed, submissions, assignment_key)
+    except Exception as e:
+        return {'error': f'Error during plagiarism detection: {str(e)}'}, 500
+    progress.add('scored', len(plagiarism_scores))
+
+    threshold = current_app.config['PLAGIARISM_THRESHOLD']
+    # Unchanged submissions still under the threshold keep the grade the model gave them last run
+    kept_grades = {
+        key: previous[key] for key in unchanged
+        if plagiarism_scores[key] < threshold and previous[key]['graded_by'] == 'model'
+    }
+    selected_for_grading = {
+        key: item for key, item in assignments_text.items()
+        if plagiarism_scores.get(key, 100) < threshold and key not in kept_grades
+    }
+
+    # Skipped submissions that need grading after all (e.g. the submission they were
+    # penalised for matching has changed) are fetched now
+    refetch = [record for record in reused if record['key'] in selected_for_grading]
+    for record in refetch:
+        del record['signature']
+    for record in extract_records(refetch):
+        assignments_text[record['key']]['text_key'] = record['index']
+    # Like any failed download these get no grade this run (and are retried next run)
+    refetch_failed = {record['key'] for record in refetch if assignments_text[record['key']]['text_key'] is None}
+    for key in refetch_failed:
+        del selected_for_grading[key]
+
+    # Grouping and grading
+    try:
+        group_grades = {
+            key: {'grade': entry['grade'], 'feedback': entry['feedback']} for key, entry in kept_grades.items()
+        }
+        model_graded = set(kept_grades)
+        progress.add('graded', len(kept_grades))
+        if selected_for_grading:
+            selected_files = list(selected_for_grading.keys())
+            selected_texts = text_store.iter_texts(selected_for_grading[key]['text_key'] for key in selected_files)
+
+            with run.stage('grouping'):
+                groups = group_similar_assignments(
+                    selected_texts,
+                    selected_files,
+                    current_app.config['GROUP_SIMILARITY_THRESHOLD']
+                )
+
+            difficulty_level = "hard"
+            assignment_context = f"""
+                Please thoroughly grade the following assignment on the topic of {assignmentDescription}.
+                Your evaluation should address the following aspects:
+                1. **Clarity and Organization:** Assess how clearly the assignment is written and how well the content is structured.
+                2. **Technical Accuracy and Depth:** Evaluate the correctness and depth of technical details related to {assignmentDescription}, including both theoretical understanding and practical application.
+                3. **Relevance to the Topic:** Check if the assignment covers key points, such as critical issues, innovative approaches, and context-specific challenges relevant to {assignmentDescription}.
+                4. **Analytical Rigor:** Critically analyze the argumentation, supporting data, and reasoning presented.
+                5. **Overall Coherence:** Consider the logical flow and coherence of the overall assignment.
+
+                Please grade the assignment at a {difficulty_level} level and provide a numerical grade out of {MAX_SCORE} along with detailed, constructive feedback highlighting both strengths and areas for improvement.
+                Make sure that the provided assignment work or extract aligns with the topic correctly.
+                """
+
+
+            print("Grading groups using Gemini API...")
+            # Group texts are joined from the store only when their grading request starts
+            combined_texts = text_store.joined(
+                [selected_for_grading[selected_files[i]]['text_key'] for i in group]
+                for group in groups
+            )
+            grading_cache = current_app.extensions['grading_cache']
+            cache_before = grading_cache.stats()
+            grading_options = dict(
+                max_in_flight=current_app.config['GRADING_MAX_IN_FLIGHT'],
+                on_result=lambda index, result: progress.add('graded', len(groups[index])),
+                api_base=current_app.config['GEMINI_API_BASE'],
+                model=current_app.config['GEMINI_MODEL'],
+                rate_limiter=current_app.extensions['gemini_rate_limiter'],
+                max_retries=current_app.config['GRADING_MAX_RETRIES'],
+                timeout=(current_app.config['GEMINI_CONNECT_TIMEOUT_SECONDS'],
+                         current_app.config['GEMINI_TIMEOUT_SECONDS']),
+                cache=grading_cache
+            )
+            with run.stage('grading'):
+                if current_app.config['GRADING_BATCH_ENABLED']:
+                    batch_stats = {}
+                    results = grade_texts_batched(
+                        combined_texts,
+                        assignment_context,
+                        pdf_context_extract,
+                        current_app.config['API_KEY'],
+                        token_budget=current_app.config['GRADING_BATCH_TOKEN_BUDGET'],
+                        max_batch_size=current_app.config['GRADING_BATCH_MAX_SUBMISSIONS'],
+                        stats=batch_stats,
+                        **grading_options
+                    )
+                    for name, value in batch_stats.items():
+                        run.count(f'grading_{name}', value)
+                else:
+                    results = grade_texts_concurrently(
+                        combined_texts,
+                        assignment_context,
+                        pdf_context_extract,
+                        current_app.config['API_KEY'],
+                        **grading_options
+                    )
+            cache_after = grading_cache.stats()
+            print(f"Grading cache: {cache_after}")
+            # Deltas of a shared cache; concurrent runs in this process are counted too
+            run.cache_result('grading', True, cache_after['hits'] - cache_before['hits'])
+            run.cache_result('grading', False, cache_after['misses'] - cache_before['misses'])
+            for group, result in zip(groups, results):
+                if result is None:
+                    print(f"Error grading group {group}")
+                    continue
+                for i in group:
+                    group_grades[selected_files[i]] = result
+                    model_graded.add(selected_files[i])
+
+        # Penalty grading
+        for key in assignments_text.keys():
+            if key not in selected_for_grading and key not in group_grades and key not in refetch_failed:
+                plagiarism_percent = plagiarism_scores.get(key, 100)
+                penalty_grade = max(0, int(60 - plagiarism_percent))
+                group_grades[key] = {
+                    'grade': penalty_grade,
+                    'feedback': f"High similarity detected with other submissions ({round(plagiarism_percent, 1)}%). Please ensure your work is original."
+                }
+                progress.add('graded')
+
+    except Exception as e:
+        return {'error': f'Error during grading: {str(e)}'}, 500
+
+    if state_key is not None:
+        try:
+            state_store.save(state_key, state_version, {
+                key: {
+                    'file_id': item['file_id'],
+                    'update_time': item['update_time'],
+                    'digest': item['digest'],
+                    'signature': minhash_dict[key],
+                    'course_score': course_scores[key],
+                    'course_match': course_matches.get(key),
+                    'grade': group_grades.get(key, {}).get('grade'),
+                    'feedback': group_grades.get(key, {}).get('feedback'),
+                    'graded_by': 'model' if key in model_graded else 'penalty' if key in group_grades else None
+                }
+                for key, item in assignments_text.items()
+            })
+        except Exception as e:
+            print(f"Error saving course state for {state_key}: {str(e)}")
+
+    # Compile results
+    submission_results = {}
+    for key, result in group_grades.items():
+        try:
+            submission_id = assignments_text[key]['submission_id']
+            submission_results[submission_id] = {
+                'user_id': assignments_text[key]['user_id'],
+                'filename': assignments_text[key]['file_name'],
+                'plagiarism_score': round(plagiarism_scores[key], 2),
+                'grade': result['grade'],
+                'feedback': result['feedback']
+            }
+        except Exception as e:
+            print(f"Error compiling result for {key}: {str(e)}")
+
+    overall_avg_plagiarism = round(np.mean(list(plagiarism_scores.values())), 2) if plagiarism_scores else 0.0
+
+    grading_results = []
+    for submission_id, result in submission_results.items():
+        grading_results.append({
+            'submission_id': submission_id,
+            'user_id': result['user_id'],
+            'filename': result['filename'],
+            'plagiarism_score': result['plagiarism_score'],
+            'grade': result['grade'],
+            'feedback': result['feedback']
+        })
+
+    body = {
+        'overall_avg_plagiarism': overall_avg_plagiarism,
+        'grading_results': grading_results,
+        'extraction_stats': {
+            field: round(value, 3) if isinstance(value, float) else value
+            for field, value in extraction_stats.items()
+        }
+    }
+    if state_key is not None:
+        body['course_state'] = {
+            'not_downloaded': len(reused) - len(refetch),
+            'unchanged': len(unchanged),
+            'changed': len(changed),
+            'removed': len(set(previous) - set(assignments_text)),
+            'grades_kept': len(kept_grades)
+        }
+        for name, value in body['course_state'].items():
+            run.count(f'course_state_{name}', value)
+    return body, 200
@@ -1,14 +1,47 @@
-import nltk
+import re
+import zlib
+import numpy as np
 from datasketch import MinHash
+from datasketch.hashfunc import sha1_hash32
+from datasketch.minhash import _max_hash, _mersenne_prime
 
-# Download NLTK data
-nltk.download('punkt_tab', quiet=True)
+# Words (keeping internal apostrophes) or single punctuation marks, roughly what
+# nltk.word_tokenize produces without its sentence splitting and contraction rules
+_TOKEN_PATTERN = re.compile(r"\w+(?:['’]\w+)*|[^\w\s]")
+
+# Bump when tokenizing or shingle hashing changes: signatures made under
+# different versions are not comparable (1 was the NLTK/SHA-1 string shingler)
+SHINGLE_HASH_VERSION = 2
+
+# Multiplier for the polynomial rolling hash over token hashes
+_ROLLING_BASE = np.uint64(0x9E3779B97F4A7C15)
+
+_MERSENNE = np.uint64(_mersenne_prime)
+_MERSENNE_SHIFT = np.uint64(61)
+_MAX_HASH = np.uint64(_max_hash)
+
+_nltk_ready = False
+
+def tokenize(text):
+    """
+    Lowercase and split text into word and punctuation tokens with a compiled regex
+    """
+    return _TOKEN_PATTERN.findall(text.lower())
 
 def get_shingles(text, default_k=5):
     """
     Create a set of word shingles (n-grams) from the text.
     For short texts (fewer than 50 tokens), use 3-word shingles for better sensitivity.
+
+    This is the original NLTK-based shingler, kept as the reference for
+    get_shingle_hashes; it downloads the punkt tokenizer data on first use.
     """
+    global _nltk_ready
+    import nltk
+    if not _nltk_ready:
+        nltk.download('punkt_tab', quiet=True)
+        _nltk_ready = True
+
     tokens = nltk.word_tokenize(text.lower())
     k = 3 if len(tokens) < 50 else default_k
     shingles = set()
@@ -20,12 +53,108 @@ def get_shingles(text, default_k=5):
             shingles.add(shingle)
     return shingles
 
+def get_shingle_hashes(text, default_k=5):
+    """
+    Create the set of word shingles of the text as 32-bit integer hashes.
+
+    Follows the same k rule as get_shingles, but tokens are hashed once each
+    with CRC32 and k-grams are combined with a vectorized polynomial rolling
+    hash, so no shingle strings are ever built.
+
+    Returns:
+        numpy.ndarray: Sorted unique uint64 array of 32-bit shingle hashes
+    """
+    tokens = tokenize(text)
+    k = 3 if len(tokens) < 50 else default_k
+
+    vocabulary = {token: zlib.crc32(token.encode('utf8')) for token in set(tokens)}
+    token_hashes = np.fromiter((vocabulary[token] for token in tokens), dtype=np.uint64, count=len(tokens))
+
+    n_shingles = max(len(tokens) - k + 1, 1)
+    k = min(k, len(tokens))
+    hashes = np.zeros(n_shingles, dtype=np.uint64)
+    for j in range(k):
+        hashes *= _ROLLING_BASE
+        hashes += token_hashes[j:j + n_shingles]
+
+    # Fold to 32 bits, the range the MinHash permutations are designed for
+    hashes = (hashes ^ (hashes >> np.uint64(32))) & np.uint64(0xFFFFFFFF)
+    return np.unique(hashes)
+
+_permutation_cache = {}
+
+def _get_permutations(num_perm):
+    """
+    Return the (a, b) permutation parameters datasketch uses for `num_perm`,
+    so batch signatures are interchangeable with MinHash objects.
+    """
+    if num_perm not in _permutation_cache:
+        _permutation_cache[num_perm] = MinHash(num_perm=num_perm).permutations
+    return _permutation_cache[num_perm]
+
+def _signatures_from_hash_arrays(hash_arrays, num_perm, chunk_size):
+    a, b = _get_permutations(num_perm)
+    hash_arrays = list(hash_arrays)
+    signatures = np.full((len(hash_arrays), num_perm), _max_hash, dtype=np.uint64)
+    for row, hv in enumerate(hash_arrays):
+        for start in range(0, len(hv), chunk_size):
+            chunk = hv[start:start + chunk_size, np.newaxis]
+            phv = chunk * a
+            phv += b
+            # x mod (2**61 - 1) without a division: fold the high bits back in
+            high = phv >> _MERSENNE_SHIFT
+            phv &= _MERSENNE
+            phv += high
+            np.subtract(phv, _MERSENNE, out=phv, where=phv >= _MERSENNE)
+            phv &= _MAX_HASH
+            np.minimum(signatures[row], phv.min(axis=0), out=signatures[row])
+    return signatures
+
+def signatures_from_shingle_sets(shingle_sets, num_perm=128, chunk_size=4096):
+    """
+    Compute MinHash signatures for many sets of string shingles (from get_shingles).
+
+    Each set is hashed with one NumPy pass over its shingles (in chunks of
+    `chunk_size` to bound memory). Returns a `(n_docs, num_perm)` uint64 matrix
+    whose rows equal datasketch MinHash.hashvalues for the same shingles.
+    """
+    return _signatures_from_hash_arrays(
+        (
+            np.fromiter(
+                (sha1_hash32(shingle.encode('utf8')) for shingle in shingles),
+                dtype=np.uint64,
+                count=len(shingles)
+            )
+            for shingles in shingle_sets
+        ),
+        num_perm,
+        chunk_size
+    )
+
+def signatures_from_shingle_hashes(hash_arrays, num_perm=128, chunk_size=4096):
+    """
+    Compute MinHash signatures for many arrays of integer shingle hashes
+    (from get_shingle_hashes). Returns a `(n_docs, num_perm)` uint64 matrix.
+    """
+    return _signatures_from_hash_arrays(
+        (np.asarray(hashes, dtype=np.uint64) for hashes in hash_arrays),
+        num_perm,
+        chunk_size
+    )
+
+def compute_min_hash_signatures(texts, default_k=5, num_perm=128):
+    """
+    Compute MinHash signatures for many documents in one batch.
+    Returns a `(n_docs, num_perm)` uint64 matrix, one row per text.
+    """
+    return signatures_from_shingle_hashes(
+        (get_shingle_hashes(text, default_k) for text in texts),
+        num_perm
+    )
+
 def compute_min_hash_for_text(text, default_k=5, num_perm=128):
     """
     Compute a MinHash signature for the given text based on its shingles.
     """
-    shingles = get_shingles(text, default_k)
-    m = MinHash(num_perm=num_perm)
-    for shingle in shingles:
-        m.update(shingle.encode('utf8'))
-    return m
\ No newline at end of file
+    signature = compute_min_hash_signatures([text], default_k, num_perm)[0]
+    return MinHash(num_perm=num_perm, hashvalues=signature)
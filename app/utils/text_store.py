@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import threading
+
+
+class TextStore:
+    """
+    Per-job on-disk store for extracted texts.
+
+    Texts are appended as UTF-8 to a single data file and read back by offset,
+    so a run only holds the texts it is working on instead of the whole class.
+    Safe to write from several pipeline threads. The store's folder is removed
+    by `close()` (or on leaving a `with` block).
+    """
+
+    def __init__(self, parent_folder):
+        os.makedirs(parent_folder, exist_ok=True)
+        self.folder = tempfile.mkdtemp(prefix='job-', dir=parent_folder)
+        self._path = os.path.join(self.folder, 'texts.bin')
+        self._file = open(self._path, 'a+b')
+        self._offsets = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def put(self, key, text):
+        """
+        Store `text` under `key`; a later put replaces it
+        """
+        data = text.encode('utf-8')
+        with self._lock:
+            self._file.seek(0, os.SEEK_END)
+            offset = self._file.tell()
+            self._file.write(data)
+            self._file.flush()
+            self._offsets[key] = (offset, len(data), len(text))
+
+    def get(self, key):
+        offset, size, _ = self._offsets[key]
+        if hasattr(os, 'pread'):
+            return os.pread(self._file.fileno(), size, offset).decode('utf-8')
+        # No pread on Windows: seek and read under the lock writers take
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(size).decode('utf-8')
+
+    def length(self, key):
+        """
+        Return the number of characters stored under `key` without reading it
+        """
+        return self._offsets[key][2]
+
+    def iter_texts(self, keys):
+        """
+        Yield the texts for `keys` one at a time
+        """
+        for key in keys:
+            yield self.get(key)
+
+    def joined(self, key_groups, separator="\n"):
+        """
+        Return a lazy sequence of the texts of each group of keys joined by
+        `separator`; a joined text is only built when it is indexed
+        """
+        return JoinedTexts(self, key_groups, separator)
+
+    def __contains__(self, key):
+        return key in self._offsets
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+
+class JoinedTexts:
+    """
+    Sequence of joined group texts read from a TextStore on access
+    """
+
+    def __init__(self, store, key_groups, separator="\n"):
+        self.store = store
+        self.key_groups = [list(keys) for keys in key_groups]
+        self.separator = separator
+
+    def __len__(self):
+        return len(self.key_groups)
+
+    def __getitem__(self, index):
+        return self.separator.join(self.store.iter_texts(self.key_groups[index]))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
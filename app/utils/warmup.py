@@ -0,0 +1,86 @@
+import os
+import shutil
+import time
+
+WARMUP_TEXT = (
+    "Warm-up submission text used to exercise tokenizing, shingling, MinHash "
+    "signatures and TF-IDF vectorization before the first real request arrives."
+)
+
+
+def warm_up(app):
+    """
+    Import heavy dependencies and prime their lazily built state once.
+
+    Under a preforking server with preload this runs in the master, so workers
+    inherit the loaded modules copy-on-write instead of importing them on their
+    first request. Marks the app ready and records per-step timings for /ready.
+    """
+    started = time.perf_counter()
+    steps = {}
+
+    def step(name, func):
+        start = time.perf_counter()
+        func()
+        steps[name] = round(time.perf_counter() - start, 3)
+
+    def imports():
+        import datasketch  # noqa: F401
+        import pdf2image  # noqa: F401
+        import pytesseract  # noqa: F401
+        import scipy.sparse.csgraph  # noqa: F401
+        import sklearn.feature_extraction.text  # noqa: F401
+
+    def minhash():
+        from app.utils.text_analysis import compute_min_hash_signatures
+        compute_min_hash_signatures([WARMUP_TEXT], app.config['SHINGLE_SIZE'], app.config['MINHASH_NUM_PERM'])
+
+    def tfidf():
+        # Loads the stop-word list and sklearn's vectorizer internals
+        from app.utils.plagiarism import tfidf_from_stream
+        tfidf_from_stream([WARMUP_TEXT, WARMUP_TEXT.upper()])
+
+    step('imports', imports)
+    step('minhash', minhash)
+    step('tfidf', tfidf)
+
+    app.extensions['warmup'] = {
+        'ready': True,
+        'pid': os.getpid(),
+        'seconds': round(time.perf_counter() - started, 3),
+        'steps': steps,
+        # OCR needs these on PATH; report them so a bad image is caught at deploy time
+        'binaries': {name: shutil.which(name) is not None for name in ('pdftotext', 'pdftoppm', 'tesseract')}
+    }
+    print(f"Warm-up finished in {app.extensions['warmup']['seconds']:.2f}s: {steps}")
+    return app.extensions['warmup']
+
+
+def reinit_after_fork(app, workers=1):
+    """
+    Recreate per-process state in a freshly forked server worker.
+
+    Threads and thread pools do not survive fork, so the job pool, heavy-job
+    limiter and OCR process pool are rebuilt. The Gemini quota and the OCR_WORKERS process budget
+    are split evenly across `workers`, because each process rate-limits and
+    runs its own OCR processes; otherwise N workers would start N * OCR_WORKERS.
+    """
+    from app.utils.file_handler import OCRPool
+    from app.utils.grading import TokenBucket
+    from app.utils.jobs import HeavyJobLimiter, JobManager
+
+    config = app.config
+    ocr_workers = app.extensions.setdefault('ocr_workers_total', config['OCR_WORKERS'])
+    config['OCR_WORKERS'] = max(1, ocr_workers // max(1, workers))
+    app.extensions['job_manager'] = JobManager(
+        app,
+        max_workers=config['JOB_WORKERS'],
+        retention_seconds=config['JOB_RETENTION_SECONDS'],
+        state_folder=config['JOB_STATE_FOLDER']
+    )
+    app.extensions['heavy_jobs'] = HeavyJobLimiter(config['MAX_HEAVY_JOBS_PER_WORKER'])
+    if 'ocr_pool' in app.extensions:
+        app.extensions['ocr_pool'].shutdown()
+    app.extensions['ocr_pool'] = OCRPool(config['OCR_WORKERS'])
+    app.extensions['gemini_rate_limiter'] = TokenBucket(config['GEMINI_REQUESTS_PER_MINUTE'] / max(1, workers))
+    app.extensions['worker_started'] = time.time()
@@ -0,0 +1,121 @@
+"""
+Measure worker memory against class size for in-memory vs disk-spilled texts.
+
+Each (mode, size) runs in a fresh subprocess that generates a synthetic class
+one text at a time and then does the text-heavy part of a run: MinHash
+signing, grouping and building every group's grading text.
+
+    memory  texts kept in a list and every group text joined up front,
+            as process_assignments did before texts were spilled
+    store   texts spilled to a TextStore, grouped from a stream and group
+            texts joined lazily, one at a time
+
+RSS is sampled before the class is generated and after the run; peak RSS is
+the subprocess's ru_maxrss.
+
+Usage:
+    python benchmarks/bench_memory.py --sizes 100 400 1600 --words 6000 [--json out.json]
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def worker(mode, size, words, seed):
+    from app.utils.metrics import current_rss_bytes, peak_rss_bytes
+    from app.utils.plagiarism import group_similar_assignments
+    from app.utils.text_analysis import compute_min_hash_signatures
+    from app.utils.text_store import TextStore
+    from benchmarks.synthetic import make_essay, make_vocabulary
+
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(4000, rng)
+    keys = list(range(size))
+    rss_before = current_rss_bytes()
+
+    store = TextStore(tempfile.gettempdir()) if mode == 'store' else None
+    texts = []
+    signatures = []
+    for _ in keys:
+        text = make_essay(words, vocabulary, rng)
+        signatures.append(compute_min_hash_signatures([text])[0])
+        if store is not None:
+            store.put(len(signatures) - 1, text)
+        else:
+            texts.append(text)
+        del text
+
+    names = [str(key) for key in keys]
+    if store is not None:
+        groups = group_similar_assignments(store.iter_texts(keys), names, 0.8)
+        group_chars = sum(len(text) for text in store.joined([[keys[i] for i in group] for group in groups]))
+    else:
+        groups = group_similar_assignments(texts, names, 0.8)
+        combined = ["\n".join(texts[i] for i in group) for group in groups]
+        group_chars = sum(len(text) for text in combined)
+
+    result = {
+        'mode': mode,
+        'size': size,
+        'words': words,
+        'groups': len(groups),
+        'group_chars': group_chars,
+        'rss_before_bytes': rss_before,
+        'rss_after_bytes': current_rss_bytes(),
+        'peak_rss_bytes': peak_rss_bytes()
+    }
+    if store is not None:
+        store.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 400, 1600], help='class sizes to run')
+    parser.add_argument('--words', type=int, default=6000, help='words per submission (~30 OCR pages)')
+    parser.add_argument('--modes', nargs='+', default=['memory', 'store'], choices=['memory', 'store'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--worker', nargs=2, metavar=('MODE', 'SIZE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        mode, size = args.worker
+        # Grouping prints every group; keep the worker's stdout for the result line
+        with open(os.devnull, 'w') as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                result = worker(mode, int(size), args.words, args.seed)
+            finally:
+                sys.stdout = stdout
+        print(json.dumps(result))
+        return
+
+    results = []
+    for size in args.sizes:
+        for mode in args.modes:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--worker', mode, str(size),
+                 '--words', str(args.words), '--seed', str(args.seed)],
+                capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            results.append(result)
+            print(f"{mode:6s} n={size:5d}: peak {result['peak_rss_bytes'] / 2**20:8.1f} MiB, "
+                  f"before {result['rss_before_bytes'] / 2**20:7.1f} MiB, "
+                  f"after {result['rss_after_bytes'] / 2**20:7.1f} MiB")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""
+Measure server startup time, first-request latency and worker memory.
+
+Starts the app either as the gunicorn production server (gunicorn.conf.py) or
+as the development server (run.py), against stub Drive and Gemini servers and
+a throwaway UPLOAD_BASE, then reports:
+
+    ready_seconds         launch until the first /ready answers 200
+    all_ready_seconds     launch until every gunicorn worker has answered /ready
+    first_request_seconds /process_assignments latency on a fresh server
+    second_request_seconds the same request again
+    *_request_graded      submissions in each request's grading_results; the
+                          script exits 1 if a request graded none
+    *_request_stages      the server's per-stage timings for each request
+    workers               RSS and PSS (shared pages split between processes)
+                          of each worker, from /proc
+
+Usage:
+    python benchmarks/bench_server.py --server gunicorn --workers 4 --json preload.json
+    python benchmarks/bench_server.py --server gunicorn --workers 4 --no-preload
+    python benchmarks/bench_server.py --server dev
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.stubs import StubDrive, StubGemini  # noqa: E402
+from benchmarks.synthetic import course_work_payload, generate_class  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def memory_kib(pid):
+    """
+    Return (RSS, PSS) of a process in KiB, or None where /proc is unavailable
+    """
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line and not line.startswith(' '))
+        return {
+            'rss_kib': int(fields['Rss'].split()[0]),
+            'pss_kib': int(fields['Pss'].split()[0])
+        }
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def wait_ready(base_url, started, expected_workers, timeout):
+    """
+    Poll /ready until it answers 200, then until `expected_workers` distinct pids have
+    """
+    ready_seconds = None
+    pids = set()
+    deadline = started + timeout
+    while time.perf_counter() < deadline:
+        try:
+            response = requests.get(f'{base_url}/ready', timeout=2)
+        except requests.RequestException:
+            time.sleep(0.05)
+            continue
+        if response.status_code == 200:
+            if ready_seconds is None:
+                ready_seconds = time.perf_counter() - started
+            pids.add(response.json()['pid'])
+            if len(pids) >= expected_workers:
+                return ready_seconds, time.perf_counter() - started, sorted(pids)
+        else:
+            time.sleep(0.05)
+    return ready_seconds, None, sorted(pids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=['gunicorn', 'dev'], default='gunicorn')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--no-preload', action='store_true', help='load the app in every worker instead of the master')
+    parser.add_argument('--submissions', type=int, default=6)
+    parser.add_argument('--pages', type=int, default=2)
+    parser.add_argument('--gemini-rpm', type=int, default=6000,
+                        help='grading rate limit (the default quota of 15 would dominate the request time)')
+    parser.add_argument('--timeout', type=float, default=120, help='seconds to wait for readiness')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    generated = generate_class(submissions=args.submissions, pages=args.pages, scanned_rate=0.0)
+    payload = course_work_payload(generated)
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    workers = args.workers if args.server == 'gunicorn' else 1
+
+    with StubDrive({s['file_id']: s['pdf'] for s in generated}) as drive, StubGemini(0.05) as gemini:
+        env = dict(
+            os.environ,
+            PORT=str(port),
+            BIND=f'127.0.0.1:{port}',
+            UPLOAD_BASE=tempfile.mkdtemp(prefix='bench-server-'),
+            DRIVE_API_BASE=drive.base_url,
+            GEMINI_API_BASE=gemini.base_url,
+            GEMINI_API_KEY='benchmark',
+            GEMINI_REQUESTS_PER_MINUTE=str(args.gemini_rpm),
+            WEB_CONCURRENCY=str(workers),
+            GUNICORN_PRELOAD='0' if args.no_preload else '1',
+            GUNICORN_ACCESS_LOG='/dev/null'
+        )
+        if args.server == 'gunicorn':
+            command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app']
+        else:
+            command = [sys.executable, 'run.py']
+
+        log = tempfile.TemporaryFile()
+        started = time.perf_counter()
+        server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            ready_seconds, all_ready_seconds, pids = wait_ready(base_url, started, workers, args.timeout)
+            results = {
+                'server': args.server,
+                'workers': workers,
+                'preload': args.server == 'gunicorn' and not args.no_preload,
+                'submissions': args.submissions,
+                'ready_seconds': ready_seconds,
+                'all_ready_seconds': all_ready_seconds
+            }
+            if ready_seconds is not None:
+                for name in ('first_request_seconds', 'second_request_seconds'):
+                    start = time.perf_counter()
+                    response = requests.post(
+                        f'{base_url}/process_assignments?timings=1',
+                        json=payload,
+                        headers={'Authorization': 'Bearer benchmark'},
+                        timeout=600
+                    )
+                    results[name] = time.perf_counter() - start
+                    results[name.replace('seconds', 'status')] = response.status_code
+                    body = response.json()
+                    results[name.replace('seconds', 'graded')] = len(body.get('grading_results', []))
+                    results[name.replace('seconds', 'stages')] = body.get('timings', {}).get('stages', {})
+                results['workers_memory'] = {str(pid): memory_kib(pid) for pid in pids}
+                results['master_memory'] = memory_kib(server.pid)
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+            log.seek(0)
+            results['log_tail'] = log.read().decode('utf-8', errors='replace').splitlines()[-15:]
+
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    # A request where every PDF failed to extract (e.g. poppler or tesseract missing)
+    # skips scoring and grading, so its latency says nothing about a real run
+    if not results.get('first_request_graded') or not results.get('second_request_graded'):
+        print("Requests graded no submissions; request latencies are not valid. "
+              "Check the server log above (are poppler and tesseract installed?)", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
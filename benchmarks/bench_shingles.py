@@ -0,0 +1,111 @@
+"""
+Benchmark the regex + rolling-hash shingler against the original NLTK shingler.
+
+Reports tokenize+shingle+sign throughput in MB/s for both implementations and
+the drift between their MinHash Jaccard estimates on synthetic document pairs
+with known overlap.
+
+Usage:
+    python benchmarks/bench_shingles.py [--docs 50] [--words 6000] [--json out.json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.text_analysis import (  # noqa: E402
+    get_shingle_hashes,
+    get_shingles,
+    signatures_from_shingle_hashes,
+    signatures_from_shingle_sets,
+)
+
+PUNCTUATION = ['.', ',', ';', ':', '(', ')']
+
+
+def make_vocabulary(size, rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(2, 10))) for _ in range(size)]
+
+
+def make_document(words, vocabulary, rng):
+    tokens = []
+    for _ in range(words):
+        token = rng.choice(vocabulary)
+        if rng.random() < 0.1:
+            token = token.capitalize()
+        tokens.append(token)
+        if rng.random() < 0.08:
+            tokens.append(rng.choice(PUNCTUATION))
+    return ' '.join(tokens)
+
+
+def mutate(text, rate, vocabulary, rng):
+    tokens = text.split(' ')
+    return ' '.join(rng.choice(vocabulary) if rng.random() < rate else token for token in tokens)
+
+
+def throughput(texts, shingle, sign):
+    megabytes = sum(len(text.encode('utf-8')) for text in texts) / 1e6
+    start = time.perf_counter()
+    sign([shingle(text) for text in texts])
+    elapsed = time.perf_counter() - start
+    return {'seconds': elapsed, 'mb_per_second': megabytes / elapsed if elapsed else float('inf')}
+
+
+def jaccard(sig_a, sig_b):
+    return float((sig_a == sig_b).mean())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=50, help='documents in the throughput run')
+    parser.add_argument('--words', type=int, default=6000, help='words per document (~30 OCR pages)')
+    parser.add_argument('--pairs', type=int, default=40, help='document pairs in the drift run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(5000, rng)
+    texts = [make_document(args.words, vocabulary, rng) for _ in range(args.docs)]
+
+    results = {
+        'docs': args.docs,
+        'words_per_doc': args.words,
+        'fast': throughput(texts, get_shingle_hashes, signatures_from_shingle_hashes),
+    }
+    try:
+        results['nltk'] = throughput(texts, get_shingles, signatures_from_shingle_sets)
+        results['speedup'] = results['nltk']['seconds'] / results['fast']['seconds']
+    except LookupError as e:
+        print(f"NLTK reference unavailable, skipping comparison: {e}")
+        print(json.dumps(results, indent=2))
+        return
+
+    # Jaccard drift on pairs spanning the similarity range
+    drifts = []
+    for i in range(args.pairs):
+        base = make_document(1500, vocabulary, rng)
+        other = mutate(base, (i % 10) / 10, vocabulary, rng)
+        fast = signatures_from_shingle_hashes([get_shingle_hashes(base), get_shingle_hashes(other)])
+        reference = signatures_from_shingle_sets([get_shingles(base), get_shingles(other)])
+        drifts.append(abs(jaccard(*fast) - jaccard(*reference)))
+    results['jaccard_drift'] = {
+        'pairs': args.pairs,
+        'mean_abs': sum(drifts) / len(drifts),
+        'max_abs': max(drifts),
+    }
+
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
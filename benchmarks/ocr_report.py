@@ -0,0 +1,143 @@
+"""
+Compare fixed-DPI and adaptive OCR on a set of PDFs.
+
+Every page is OCR'd both ways (the text layer is ignored) and timed. Character
+accuracy is measured against the page's own text layer where it is usable, and
+otherwise against a fixed OCR pass at --reference-dpi. Accuracy is the share
+of reference characters found in order in the OCR output (difflib matching
+blocks over whitespace-normalised text).
+
+Usage:
+    python benchmarks/ocr_report.py                      # every PDF under uploads/
+    python benchmarks/ocr_report.py a.pdf b.pdf --max-pages 5 --json ocr.json
+"""
+import argparse
+import difflib
+import glob
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pdf2image import pdfinfo_from_path  # noqa: E402
+
+from app.utils.file_handler import (  # noqa: E402
+    ADAPTIVE_OCR_DEFAULTS,
+    _native_page_texts,
+    has_usable_text_layer,
+    ocr_page,
+)
+
+
+def normalise(text):
+    return ' '.join(text.split())
+
+
+def character_accuracy(reference, hypothesis):
+    reference, hypothesis = normalise(reference), normalise(hypothesis)
+    if not reference:
+        return 1.0 if not hypothesis else 0.0
+    matcher = difflib.SequenceMatcher(None, reference, hypothesis, autojunk=False)
+    return sum(block.size for block in matcher.get_matching_blocks()) / len(reference)
+
+
+def timed_ocr(path, page_number, dpi, options=None):
+    start = time.perf_counter()
+    text, info = ocr_page(path, page_number, dpi, options)
+    return text, info, time.perf_counter() - start
+
+
+def report_pdf(path, args, options):
+    page_count = pdfinfo_from_path(path)['Pages']
+    if args.max_pages:
+        page_count = min(page_count, args.max_pages)
+    native_texts = _native_page_texts(path, 1, page_count) or []
+
+    pages = []
+    for page_number in range(1, page_count + 1):
+        native = native_texts[page_number - 1] if page_number - 1 < len(native_texts) else ''
+        fixed_text, _, fixed_seconds = timed_ocr(path, page_number, args.dpi)
+        adaptive_text, info, adaptive_seconds = timed_ocr(path, page_number, args.dpi, options)
+
+        if has_usable_text_layer(native):
+            reference, reference_kind = native, 'text_layer'
+        else:
+            reference, _, _ = timed_ocr(path, page_number, args.reference_dpi)
+            reference_kind = f'ocr@{args.reference_dpi}'
+
+        pages.append({
+            'page': page_number,
+            'reference': reference_kind,
+            'fixed_seconds': fixed_seconds,
+            'adaptive_seconds': adaptive_seconds,
+            'fixed_accuracy': character_accuracy(reference, fixed_text),
+            'adaptive_accuracy': character_accuracy(reference, adaptive_text),
+            'adaptive_dpi': info['dpi'],
+            'blank': info['blank'],
+            'reocr': info['reocr'],
+            'confidence': info['confidence']
+        })
+    return summarise(pages, path)
+
+
+def summarise(pages, name):
+    fixed_seconds = sum(page['fixed_seconds'] for page in pages)
+    adaptive_seconds = sum(page['adaptive_seconds'] for page in pages)
+    fixed_accuracy = sum(page['fixed_accuracy'] for page in pages) / len(pages) if pages else None
+    adaptive_accuracy = sum(page['adaptive_accuracy'] for page in pages) / len(pages) if pages else None
+    return {
+        'pdf': name,
+        'pages': len(pages),
+        'fixed_seconds': fixed_seconds,
+        'adaptive_seconds': adaptive_seconds,
+        'speedup': fixed_seconds / adaptive_seconds if adaptive_seconds else None,
+        'fixed_accuracy': fixed_accuracy,
+        'adaptive_accuracy': adaptive_accuracy,
+        'accuracy_delta': adaptive_accuracy - fixed_accuracy if pages else None,
+        'blank_pages': sum(page['blank'] for page in pages),
+        'reocr_pages': sum(page['reocr'] for page in pages),
+        'page_details': pages
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pdfs', nargs='*', help='PDFs to compare (default: every PDF under uploads/)')
+    parser.add_argument('--dpi', type=int, default=200, help='fixed-mode DPI, as OCR_DPI')
+    parser.add_argument('--reference-dpi', type=int, default=300, help='OCR DPI for pages without a text layer')
+    parser.add_argument('--max-pages', type=int, help='pages per PDF to compare')
+    parser.add_argument('--min-confidence', type=float, default=ADAPTIVE_OCR_DEFAULTS['min_confidence'])
+    parser.add_argument('--json', help='write the report to this file')
+    args = parser.parse_args()
+
+    paths = args.pdfs or sorted(glob.glob(os.path.join(ROOT, 'uploads', '**', '*.pdf'), recursive=True))
+    options = {**ADAPTIVE_OCR_DEFAULTS, 'min_confidence': args.min_confidence}
+
+    documents = []
+    for path in paths:
+        try:
+            document = report_pdf(path, args, options)
+        except Exception as e:
+            print(f"Skipping {path}: {type(e).__name__}: {e}")
+            continue
+        documents.append(document)
+        print(f"{os.path.relpath(path, ROOT)}: {document['pages']} pages, "
+              f"{document['fixed_seconds']:.1f}s -> {document['adaptive_seconds']:.1f}s, "
+              f"accuracy {document['fixed_accuracy']:.3f} -> {document['adaptive_accuracy']:.3f}")
+
+    all_pages = [page for document in documents for page in document['page_details']]
+    overall = summarise(all_pages, 'overall')
+    overall.pop('page_details')
+    report = {'params': vars(args), 'adaptive_options': options, 'overall': overall, 'documents': documents}
+
+    print(json.dumps(overall, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
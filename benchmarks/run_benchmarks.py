@@ -0,0 +1,274 @@
+"""
+Benchmark the processing pipeline on a reproducible synthetic class.
+
+Times text extraction (text-layer and scanned PDFs), MinHash signing,
+plagiarism scoring, grouping and the full /process_assignments endpoint
+against local stub Drive and Gemini servers, and writes the results as JSON
+so runs from different commits can be compared with --compare.
+
+Usage:
+    python benchmarks/run_benchmarks.py --submissions 30 --pages 3 --output results.json
+    python benchmarks/run_benchmarks.py --output new.json --compare results.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.stubs import StubDrive, StubGemini  # noqa: E402
+from benchmarks.synthetic import course_work_payload, generate_class  # noqa: E402
+from app.utils.file_handler import OCRPool, extract_text_from_pdf  # noqa: E402
+from app.utils.plagiarism import calculate_plagiarism_scores, group_similar_assignments, lsh_recall  # noqa: E402
+from app.utils.text_analysis import compute_min_hash_for_text  # noqa: E402
+
+
+def measure(func, repeat):
+    """
+    Run `func` `repeat` times and summarise the wall-clock seconds.
+    The last return value is kept so callers can report on the output.
+    """
+    seconds = []
+    value = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = func()
+        seconds.append(time.perf_counter() - start)
+    return {
+        'repeat': repeat,
+        'min_seconds': min(seconds),
+        'median_seconds': statistics.median(seconds),
+        'mean_seconds': statistics.mean(seconds)
+    }, value
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def bench_extraction(pdf_paths, repeat, args):
+    pages = sum(args.pages for _ in pdf_paths)
+    # One pool for every document, as a server worker keeps it
+    pool = OCRPool(args.ocr_workers) if args.ocr_workers > 1 else None
+
+    def run():
+        return [
+            extract_text_from_pdf(path, dpi=args.ocr_dpi, workers=args.ocr_workers, pool=pool)
+            for path in pdf_paths
+        ]
+
+    try:
+        result, texts = measure(run, repeat)
+    except Exception as e:
+        return {'error': f'{type(e).__name__}: {e}'}
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    result['documents'] = len(pdf_paths)
+    result['pages_per_second'] = pages / result['median_seconds'] if result['median_seconds'] else None
+    result['empty_documents'] = sum(1 for text in texts if not text)
+    if result['empty_documents'] == len(pdf_paths):
+        result['warning'] = 'No text extracted; check that poppler and tesseract are installed'
+    return result
+
+
+def bench_endpoint(generated, args):
+    from app import create_app
+    from app.config import Config
+
+    folder = tempfile.mkdtemp(prefix='bench-endpoint-')
+    for name in ('UPLOAD_FOLDER', 'HANDWRITTEN_FOLDER', 'CONTEXT_FOLDER', 'SUBMISSIONS_FOLDER',
+                 'EXTRACTION_CACHE_FOLDER', 'CORPUS_FOLDER', 'TEXT_STORE_FOLDER', 'JOB_STATE_FOLDER',
+                 'COURSE_STATE_FOLDER'):
+        setattr(Config, name, os.path.join(folder, name.lower()))
+    Config.GRADING_CACHE_PATH = os.path.join(folder, 'grading.sqlite3')
+    Config.API_KEY = 'benchmark'
+    Config.GEMINI_REQUESTS_PER_MINUTE = args.gemini_rpm
+    Config.OCR_DPI = args.ocr_dpi
+    Config.OCR_WORKERS = args.ocr_workers
+    Config.GRADING_BATCH_ENABLED = args.batch_grading
+
+    payload = course_work_payload(generated)
+    results = {}
+    with StubDrive({s['file_id']: s['pdf'] for s in generated}, args.drive_latency) as drive, \
+            StubGemini(args.gemini_latency) as gemini:
+        Config.DRIVE_API_BASE = drive.base_url
+        Config.GEMINI_API_BASE = gemini.base_url
+        client = create_app().test_client()
+
+        # The first request starts with empty extraction and grading caches,
+        # later ones measure the warm path
+        for run in ('cold', 'warm'):
+            start = time.perf_counter()
+            response = client.post(
+                '/process_assignments?timings=1',
+                json=payload,
+                headers={'Authorization': 'Bearer benchmark'}
+            )
+            seconds = time.perf_counter() - start
+            body = response.get_json() or {}
+            timings = body.get('timings', {})
+            results[run] = {
+                'status': response.status_code,
+                'seconds': seconds,
+                'graded': len(body.get('grading_results', [])),
+                'stages': timings.get('stages', {}),
+                'caches': timings.get('caches', {}),
+                'peak_rss_bytes': timings.get('peak_rss_bytes'),
+                'error': body.get('error')
+            }
+            # A run where every PDF failed to extract skips scoring and grading,
+            # so its time says nothing about a real run
+            if not results[run]['graded']:
+                results[run]['warning'] = 'No submissions graded; check that poppler and tesseract are installed'
+        results['drive_requests'] = drive.requests
+        results['gemini_requests'] = gemini.requests
+        results['gemini_prompt_chars'] = gemini.prompt_chars
+    return results
+
+
+def compare(results, baseline_path):
+    """
+    Print the median-time ratio of every benchmark against a baseline run
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline.get('meta', {}).get('commit') or baseline_path}:")
+    for name, current in results['results'].items():
+        previous = baseline.get('results', {}).get(name, {})
+        if 'median_seconds' in current and previous.get('median_seconds'):
+            ratio = current['median_seconds'] / previous['median_seconds']
+            print(f"  {name:32s} {previous['median_seconds']:9.4f}s -> {current['median_seconds']:9.4f}s "
+                  f"({ratio:.2f}x)")
+        if 'lsh_recall' in current and 'lsh_recall' in previous:
+            print(f"  {name + ' recall':32s} {previous['lsh_recall']:9.4f}  -> {current['lsh_recall']:9.4f}")
+    for run in ('cold', 'warm'):
+        current = results['results'].get('endpoint', {}).get(run, {})
+        previous = baseline.get('results', {}).get('endpoint', {}).get(run, {})
+        if current and previous and not (current.get('graded') and previous.get('graded')):
+            print(f"  {'endpoint ' + run:32s} skipped: a run graded no submissions")
+        elif current.get('seconds') and previous.get('seconds'):
+            print(f"  {'endpoint ' + run:32s} {previous['seconds']:9.4f}s -> {current['seconds']:9.4f}s "
+                  f"({current['seconds'] / previous['seconds']:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--submissions', type=int, default=30)
+    parser.add_argument('--pages', type=int, default=3, help='pages per submission')
+    parser.add_argument('--duplicate-rate', type=float, default=0.2, help='fraction of near-duplicate submissions')
+    parser.add_argument('--mutation-rate', type=float, default=0.05, help='fraction of words changed in a copy')
+    parser.add_argument('--scanned-rate', type=float, default=0.3, help='fraction of image-only PDFs')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per micro-benchmark (median is reported)')
+    parser.add_argument('--ocr-dpi', type=int, default=200)
+    parser.add_argument('--ocr-workers', type=int, default=1)
+    parser.add_argument('--drive-latency', type=float, default=0.02, help='stub Drive seconds per download')
+    parser.add_argument('--gemini-latency', type=float, default=0.2, help='stub Gemini seconds per request')
+    parser.add_argument('--gemini-rpm', type=int, default=6000, help='grading rate limit during the run')
+    parser.add_argument('--batch-grading', action='store_true', help='pack groups into shared grading prompts')
+    parser.add_argument('--plagiarism-threshold', type=float, default=30)
+    parser.add_argument('--group-threshold', type=float, default=0.8)
+    parser.add_argument('--skip-extraction', action='store_true', help='skip the OCR/text-layer benchmarks')
+    parser.add_argument('--skip-endpoint', action='store_true', help='skip the full endpoint benchmark')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='baseline JSON from an earlier run')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    generated = generate_class(
+        submissions=args.submissions,
+        pages=args.pages,
+        duplicate_rate=args.duplicate_rate,
+        mutation_rate=args.mutation_rate,
+        scanned_rate=args.scanned_rate,
+        seed=args.seed
+    )
+    generation_seconds = time.perf_counter() - start
+
+    commit, dirty = git_revision()
+    results = {
+        'meta': {
+            'commit': commit,
+            'dirty': dirty,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'generation_seconds': generation_seconds
+        },
+        'params': vars(args),
+        'results': {}
+    }
+    benchmarks = results['results']
+
+    pdf_folder = tempfile.mkdtemp(prefix='bench-pdfs-')
+    paths = {'text_layer': [], 'scanned': []}
+    for submission in generated:
+        path = os.path.join(pdf_folder, submission['title'])
+        with open(path, 'wb') as f:
+            f.write(submission['pdf'])
+        paths['scanned' if submission['scanned'] else 'text_layer'].append(path)
+
+    if not args.skip_extraction:
+        for kind, pdf_paths in paths.items():
+            if pdf_paths:
+                benchmarks[f'extract_text_from_pdf[{kind}]'] = bench_extraction(pdf_paths, args.repeat, args)
+
+    # The remaining stages run on the generator's ground-truth text, so they
+    # are measured even where poppler/tesseract are not installed
+    keys = [f"{s['id']}_{s['title']}" for s in generated]
+    assignments_text = {key: {'text': s['text']} for key, s in zip(keys, generated)}
+
+    benchmarks['compute_min_hash_for_text'], signatures = measure(
+        lambda: [compute_min_hash_for_text(s['text']) for s in generated], args.repeat
+    )
+    minhash_dict = dict(zip(keys, signatures))
+
+    benchmarks['calculate_plagiarism_scores'], scores = measure(
+        lambda: calculate_plagiarism_scores(minhash_dict, assignments_text), args.repeat
+    )
+    copies = [key for key, s in zip(keys, generated) if s['copied_from']]
+    flagged = {key for key, score in scores.items() if score >= args.plagiarism_threshold}
+    # Against the all-pairs baseline: how many flagged maxima LSH found exactly
+    recall = lsh_recall(minhash_dict, assignments_text, scores, args.plagiarism_threshold)
+    benchmarks['calculate_plagiarism_scores'].update({
+        'near_duplicates': len(copies),
+        'near_duplicates_flagged': sum(1 for key in copies if key in flagged),
+        'flagged': len(flagged),
+        'lsh_recall': recall['recall'],
+        'brute_force_flagged': recall['flagged']
+    })
+
+    benchmarks['group_similar_assignments'], groups = measure(
+        lambda: group_similar_assignments([s['text'] for s in generated], keys, args.group_threshold), args.repeat
+    )
+    benchmarks['group_similar_assignments']['groups'] = len(groups)
+
+    if not args.skip_endpoint:
+        benchmarks['endpoint'] = bench_endpoint(generated, args)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
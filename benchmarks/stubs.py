@@ -0,0 +1,132 @@
+"""
+Local stand-ins for the Google Drive and Gemini APIs used by the benchmarks.
+
+Both run an HTTP server on a background thread and expose `base_url`, to be
+set as DRIVE_API_BASE / GEMINI_API_BASE. Latency is configurable so network
+wait can be modelled without depending on the real services, and `failures`
+(HTTP status codes such as 429 or 503) are answered to the first requests, in
+order, with a `Retry-After` header, to exercise the clients' retries.
+"""
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _StubServer:
+    def __init__(self, handler, failures=(), retry_after=0):
+        self.requests = 0
+        self.failures = list(failures)
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(handler):
+            def log_message(self, *args):
+                pass
+
+            def count(self):
+                with stub._lock:
+                    stub.requests += 1
+
+            def fail(self):
+                """
+                Answer with the next queued failure status, if any is left
+                """
+                with stub._lock:
+                    status = stub.failures.pop(0) if stub.failures else None
+                if status is None:
+                    return False
+                self.send_response(status)
+                self.send_header('Retry-After', str(stub.retry_after))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return True
+
+        Handler.stub = self
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _DriveHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.count()
+        if self.fail():
+            return
+        match = re.match(r'/files/([^/?]+)', self.path)
+        content = self.stub.files.get(match.group(1)) if match else None
+        time.sleep(self.stub.latency)
+        if content is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/pdf')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class StubDrive(_StubServer):
+    """
+    Serves `files` (file_id -> bytes) at /files/<id>?alt=media
+    """
+
+    def __init__(self, files, latency=0.0, failures=(), retry_after=0):
+        self.files = files
+        self.latency = latency
+        super().__init__(_DriveHandler, failures, retry_after)
+
+
+class _GeminiHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.count()
+        if self.fail():
+            return
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        prompt = payload['contents'][0]['parts'][0]['text']
+        time.sleep(self.stub.latency)
+        # Deterministic grades from the prompt so repeated runs agree
+        ids = re.findall(r'<submission id="([^"]+)">', prompt)
+        if ids:
+            text = json.dumps([
+                {'id': item_id, 'grade': 50 + (len(prompt) + i) % 50, 'feedback': 'Stub feedback.'}
+                for i, item_id in enumerate(ids)
+            ])
+        else:
+            text = f'Overall Grade: {50 + len(prompt) % 50}/100\nStub feedback.'
+        with self.stub._lock:
+            self.stub.prompt_chars += len(prompt)
+        body = json.dumps({'candidates': [{'content': {'parts': [{'text': text}]}}]}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubGemini(_StubServer):
+    """
+    Answers generateContent requests after `latency` seconds: batch prompts
+    with a JSON array of grades, single prompts with 'Overall Grade: N/100'.
+    `prompt_chars` totals the prompt text received.
+    """
+
+    def __init__(self, latency=0.2, failures=(), retry_after=0):
+        self.latency = latency
+        self.prompt_chars = 0
+        super().__init__(_GeminiHandler, failures, retry_after)
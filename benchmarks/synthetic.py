@@ -0,0 +1,183 @@
+"""
+Synthetic class generator for the benchmarks.
+
+Builds a reproducible class of submissions from a seed: each submission has a
+known text, a PDF rendering of it (with a text layer, or scanned as page
+images), and submissions drawn as near-duplicates record which submission
+they were copied from, so plagiarism results can be checked against ground truth.
+"""
+import io
+import random
+
+from PIL import Image, ImageDraw, ImageFont
+
+WORDS_PER_LINE = 12
+LINES_PER_PAGE = 40
+PUNCTUATION = ['.', ',', ';', ':']
+
+
+def make_vocabulary(size, rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(3, 9))) for _ in range(size)]
+
+
+def make_essay(words, vocabulary, rng):
+    tokens = []
+    for _ in range(words):
+        token = rng.choice(vocabulary)
+        if rng.random() < 0.06:
+            token += rng.choice(PUNCTUATION)
+        tokens.append(token)
+    return ' '.join(tokens)
+
+
+def near_duplicate(text, rate, vocabulary, rng):
+    """
+    Copy `text` with a fraction `rate` of its words replaced
+    """
+    return ' '.join(rng.choice(vocabulary) if rng.random() < rate else word for word in text.split(' '))
+
+
+def paginate(text):
+    """
+    Split text into pages of lines as they are laid out in the generated PDFs
+    """
+    words = text.split(' ')
+    lines = [' '.join(words[i:i + WORDS_PER_LINE]) for i in range(0, len(words), WORDS_PER_LINE)]
+    return [lines[i:i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE)] or [[]]
+
+
+def _pdf_string(line):
+    return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def text_layer_pdf(text):
+    """
+    Render text as a minimal PDF with an embedded Helvetica text layer
+    """
+    pages = paginate(text)
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>', None, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    page_ids = []
+    for lines in pages:
+        stream = 'BT /F1 10 Tf 14 TL 50 760 Td\n' + ''.join(f'({_pdf_string(line)}) Tj T*\n' for line in lines) + 'ET'
+        stream = stream.encode('latin-1')
+        objects.append(b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+        objects.append(
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+            b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' % (len(objects))
+        )
+        page_ids.append(len(objects))
+    kids = ' '.join(f'{page_id} 0 R' for page_id in page_ids)
+    objects[1] = f'<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>'.encode('latin-1')
+
+    out = io.BytesIO()
+    out.write(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+    xref = out.tell()
+    out.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b'%010d 00000 n \n' % offset)
+    out.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def _load_font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow without FreeType support only has the fixed bitmap font
+        return ImageFont.load_default()
+
+
+def scanned_pdf(text, dpi=150, seed=0):
+    """
+    Render text as an image-only PDF, like a scanned handwritten submission.
+    Pages carry light speckle noise so they are not trivially clean.
+    """
+    rng = random.Random(seed)
+    width, height = int(8.5 * dpi), int(11 * dpi)
+    font = _load_font(max(dpi // 7, 10))
+    line_height = int(dpi * 14 / 72)
+    images = []
+    for lines in paginate(text):
+        image = Image.new('L', (width, height), 255)
+        draw = ImageDraw.Draw(image)
+        y = int(dpi * 0.45)
+        for line in lines:
+            draw.text((int(dpi * 0.7), y), line, fill=0, font=font)
+            y += line_height
+        for _ in range(width * height // 4000):
+            draw.point((rng.randrange(width), rng.randrange(height)), fill=rng.randint(120, 200))
+        images.append(image)
+
+    out = io.BytesIO()
+    images[0].save(out, format='PDF', save_all=True, append_images=images[1:], resolution=dpi)
+    return out.getvalue()
+
+
+def generate_class(submissions=30, pages=3, duplicate_rate=0.2, mutation_rate=0.05, scanned_rate=0.3,
+                   words_per_page=None, scan_dpi=150, seed=0):
+    """
+    Generate a synthetic class.
+
+    Args:
+        submissions (int): Number of submissions
+        pages (int): Pages per submission
+        duplicate_rate (float): Fraction of submissions copied from an earlier one
+        mutation_rate (float): Fraction of words changed in each copy
+        scanned_rate (float): Fraction of submissions rendered as scanned images
+        seed (int): Seed for every random choice, so classes are reproducible
+
+    Returns:
+        list: One dict per submission with id, file_id, title, text, pdf (bytes),
+        scanned (bool) and copied_from (the source file_id or None)
+    """
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(4000, rng)
+    words = (words_per_page or WORDS_PER_LINE * LINES_PER_PAGE) * pages
+
+    generated = []
+    for index in range(submissions):
+        copied_from = None
+        if generated and rng.random() < duplicate_rate:
+            source = rng.choice(generated)
+            copied_from = source['file_id']
+            text = near_duplicate(source['text'], mutation_rate, vocabulary, rng)
+        else:
+            text = make_essay(words, vocabulary, rng)
+
+        scanned = rng.random() < scanned_rate
+        file_id = f'file{index:04d}'
+        generated.append({
+            'id': f'sub{index:04d}',
+            'user_id': f'user{index:04d}',
+            'file_id': file_id,
+            'title': f'{file_id}.pdf',
+            'text': text,
+            'pdf': scanned_pdf(text, scan_dpi, seed=seed + index) if scanned else text_layer_pdf(text),
+            'scanned': scanned,
+            'copied_from': copied_from
+        })
+    return generated
+
+
+def course_work_payload(generated, title='Synthetic assignment', description='Benchmark essay', max_points=100):
+    """
+    Build a /process_assignments request body for a generated class
+    """
+    return {
+        'assignmentInfo': {'title': title, 'description': description, 'maxPoints': max_points},
+        'courseWork': [
+            {
+                'id': submission['id'],
+                'userId': submission['user_id'],
+                'assignmentSubmission': {
+                    'attachments': [{'driveFile': {'id': submission['file_id'], 'title': submission['title']}}]
+                }
+            }
+            for submission in generated
+        ]
+    }
@@ -0,0 +1,43 @@
+"""
+Gunicorn settings for production serving:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every setting can be overridden from the environment. Each worker runs at most
+MAX_HEAVY_JOBS_PER_WORKER processing runs at once; its extra threads keep
+/ready, /metrics and /jobs polling responsive while a run is in progress.
+"""
+import multiprocessing
+import os
+import time
+
+bind = os.getenv('BIND', f"0.0.0.0:{os.getenv('PORT', '5002')}")
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+
+# Import and warm the app once in the master; workers share it copy-on-write
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') != '0'
+
+# Synchronous /process_assignments runs can take minutes for a large class
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 900))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 60))
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+
+_started = time.time()
+
+
+def when_ready(server):
+    server.log.info(f"Master ready in {time.time() - _started:.2f}s (preload_app={preload_app}, workers={workers})")
+
+
+def post_fork(server, worker):
+    # Thread pools, locks and the rate limiter must be per process
+    import wsgi
+    from app.utils.warmup import reinit_after_fork
+    reinit_after_fork(wsgi.app, server.cfg.workers)
+    worker.forked_at = time.time()
+
+
+def post_worker_init(worker):
+    worker.log.info(f"Worker {worker.pid} serving {time.time() - worker.forked_at:.2f}s after fork")
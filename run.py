@@ -1,8 +1,12 @@
 from app import create_app
+from app.utils.warmup import warm_up
 import os
 
-app = create_app()
-
+# Development server; use `gunicorn -c gunicorn.conf.py wsgi:app` in production.
+# The app is built under the main guard because OCR pool processes re-import
+# this module.
 if __name__ == '__main__':
+    app = create_app()
+    warm_up(app)
     port = int(os.environ.get("PORT", 5002))
-    app.run(host="0.0.0.0", port=port, debug=True)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=port, debug=True)
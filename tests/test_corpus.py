@@ -0,0 +1,154 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.utils.corpus import SignatureCorpus
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+def random_signature(rng):
+    return rng.integers(0, 2 ** 32, 128, dtype=np.uint64)
+
+
+def near_copy(rng, signature, changed=12):
+    copy = signature.copy()
+    positions = rng.choice(len(copy), changed, replace=False)
+    copy[positions] = rng.integers(0, 2 ** 32, changed, dtype=np.uint64)
+    return copy
+
+
+def test_query_finds_exact_and_near_copies(tmp_path, rng):
+    corpus = SignatureCorpus(str(tmp_path))
+    original = random_signature(rng)
+    corpus.insert_many([('original', original), ('other', random_signature(rng))])
+
+    assert corpus.query(original) == [('original', 1.0)]
+    matches = corpus.query(near_copy(rng, original))
+    assert [key for key, _ in matches] == ['original']
+    assert matches[0][1] == pytest.approx(1 - 12 / 128, abs=0.01)
+    assert corpus.query(random_signature(rng)) == []
+    assert len(corpus) == 2 and 'other' in corpus
+
+
+def test_insert_replaces_and_delete_removes(tmp_path, rng):
+    corpus = SignatureCorpus(str(tmp_path))
+    first, second = random_signature(rng), random_signature(rng)
+    corpus.insert('doc', first)
+    corpus.insert('doc', second)
+    assert len(corpus) == 1
+    assert corpus.query(first) == []
+    assert corpus.query(second) == [('doc', 1.0)]
+
+    corpus.delete('doc')
+    corpus.delete('missing')
+    assert len(corpus) == 0
+    assert corpus.query(second) == []
+    assert len(SignatureCorpus(str(tmp_path))) == 0
+
+
+def test_index_and_tail_agree_across_processes(tmp_path, rng):
+    writer = SignatureCorpus(str(tmp_path), tail_limit=3)
+    reader = SignatureCorpus(str(tmp_path), tail_limit=3)
+    signatures = {f'doc{i}': random_signature(rng) for i in range(10)}
+    for key, signature in signatures.items():
+        writer.insert(key, signature)
+
+    reader.refresh()
+    assert 0 < reader._indexed_rows < len(signatures)
+    for key, signature in signatures.items():
+        assert reader.query(signature) == [(key, 1.0)]
+        assert writer.query(signature) == [(key, 1.0)]
+
+
+def test_query_excludes_same_submission_and_assignment(tmp_path, rng):
+    corpus = SignatureCorpus(str(tmp_path))
+    essay = random_signature(rng)
+    corpus.insert('s1_draft.pdf', essay, owner={'submission': 's1', 'assignment': 'c1/w1'})
+    corpus.insert('s2_copy.pdf', essay, owner={'submission': 's2', 'assignment': 'c1/w2'})
+
+    assert {key for key, _ in corpus.query(essay)} == {'s1_draft.pdf', 's2_copy.pdf'}
+    assert corpus.query(essay, exclude=['s2_copy.pdf']) == [('s1_draft.pdf', 1.0)]
+    assert corpus.query(essay, exclude_submissions={'s1'}) == [('s2_copy.pdf', 1.0)]
+    assert corpus.query(essay, exclude_assignment='c1/w2') == [('s1_draft.pdf', 1.0)]
+    # Owners survive a reopen
+    assert SignatureCorpus(str(tmp_path)).query(essay, exclude_submissions={'s1'}) == [('s2_copy.pdf', 1.0)]
+
+
+def test_insert_discards_rows_of_a_writer_that_died(tmp_path, rng):
+    corpus = SignatureCorpus(str(tmp_path))
+    first = random_signature(rng)
+    corpus.insert('first', first)
+    # A writer that died after appending its rows but before finishing its log entry
+    with open(tmp_path / 'signatures.bin', 'ab') as f:
+        f.write(random_signature(rng).tobytes())
+    with open(tmp_path / 'bandhash.bin', 'ab') as f:
+        f.write(b'\0' * 64 * 8)
+    with open(tmp_path / 'keys.log', 'a') as f:
+        f.write('{"op": "add", "ke')
+
+    second = random_signature(rng)
+    corpus.insert('second', second)
+    reopened = SignatureCorpus(str(tmp_path))
+    assert reopened.query(first) == [('first', 1.0)]
+    assert reopened.query(second) == [('second', 1.0)]
+    assert os.path.getsize(tmp_path / 'signatures.bin') == 2 * 128 * 8
+
+
+def test_other_hash_version_is_moved_aside(tmp_path, rng):
+    signature = random_signature(rng)
+    SignatureCorpus(str(tmp_path), hash_version=1).insert('old', signature)
+
+    corpus = SignatureCorpus(str(tmp_path), hash_version=2)
+    assert len(corpus) == 0
+    assert corpus.query(signature) == []
+    assert any(name.startswith('stale-v1-') for name in os.listdir(tmp_path))
+
+
+def test_reinserting_the_same_signatures_adds_no_rows(tmp_path, rng):
+    corpus = SignatureCorpus(str(tmp_path))
+    items = [(f'doc{i}', random_signature(rng)) for i in range(16)]
+    owners = {key: {'submission': key, 'assignment': 'c1/w1'} for key, _ in items}
+    corpus.insert_many(items, owners)
+    sizes = [os.path.getsize(tmp_path / name) for name in ('signatures.bin', 'keys.log')]
+    for _ in range(4):
+        corpus.insert_many(items, owners)
+    assert len(corpus.row_keys) == 16 and len(corpus) == 16
+    assert [os.path.getsize(tmp_path / name) for name in ('signatures.bin', 'keys.log')] == sizes
+
+    # A changed signature or owner still replaces the row
+    corpus.insert('doc0', random_signature(rng), owner=owners['doc0'])
+    corpus.insert('doc1', items[1][1], owner={'submission': 'doc1', 'assignment': 'c1/w2'})
+    assert len(corpus.row_keys) == 18 and len(corpus) == 16
+
+
+def test_rebuild_compacts_dead_rows(tmp_path, rng):
+    corpus = SignatureCorpus(str(tmp_path), tail_limit=1000)
+    reader = SignatureCorpus(str(tmp_path))
+    signatures = {f'doc{i}': random_signature(rng) for i in range(20)}
+    corpus.insert_many(signatures.items())
+    for key in list(signatures)[:10]:
+        signatures[key] = random_signature(rng)
+        corpus.insert(key, signatures[key])
+    corpus.delete('doc19')
+    del signatures['doc19']
+    reader.refresh()
+    assert len(reader.row_keys) == 30
+
+    corpus.rebuild_index()
+    assert len(corpus.row_keys) == len(corpus) == 19
+    assert not os.path.exists(tmp_path / 'signatures.bin')
+    for instance in (corpus, reader, SignatureCorpus(str(tmp_path))):
+        instance.refresh()
+        assert len(instance.row_keys) == 19 and instance._indexed_rows == 19
+        for key, signature in signatures.items():
+            assert instance.query(signature) == [(key, 1.0)]
+
+    # Writes after the compaction land in the new generation
+    corpus.insert('late', random_signature(rng))
+    reader.refresh()
+    assert 'late' in reader and len(reader) == 20
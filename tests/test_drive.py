@@ -0,0 +1,40 @@
+import hashlib
+import os
+
+from app.utils.drive import create_drive_session, download_drive_file
+from benchmarks.stubs import StubDrive
+
+CONTENT = b'%PDF-1.4 stub content'
+
+
+def download(drive, tmp_path, retries=3):
+    session = create_drive_session(max_connections=1, retries=retries, backoff_factor=0)
+    path = os.path.join(tmp_path, 'out.pdf')
+    try:
+        return download_drive_file(session, 'f1', 'token', path, base_url=drive.base_url), path
+    finally:
+        session.close()
+
+
+def test_download_retries_429_and_5xx(tmp_path):
+    with StubDrive({'f1': CONTENT}, failures=[429, 503]) as drive:
+        digest, path = download(drive, tmp_path)
+    assert digest == hashlib.sha256(CONTENT).hexdigest()
+    assert drive.requests == 3
+    with open(path, 'rb') as f:
+        assert f.read() == CONTENT
+
+
+def test_download_gives_up_after_retries(tmp_path):
+    with StubDrive({'f1': CONTENT}, failures=[503] * 5) as drive:
+        digest, path = download(drive, tmp_path, retries=2)
+    assert digest is None
+    assert drive.requests == 3
+    assert not os.path.exists(path)
+
+
+def test_download_does_not_retry_missing_file(tmp_path):
+    with StubDrive({}) as drive:
+        digest, _ = download(drive, tmp_path)
+    assert digest is None
+    assert drive.requests == 1
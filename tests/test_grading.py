@@ -0,0 +1,72 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from app.utils import grading
+from app.utils.cache import MemoryLRUCache
+from app.utils.grading import call_gemini_api_cached, call_gemini_batch
+from benchmarks.stubs import StubGemini
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """
+    Record the retry waits instead of sleeping through them
+    """
+    waits = []
+    monkeypatch.setattr(grading, 'time', SimpleNamespace(sleep=waits.append, monotonic=time.monotonic))
+    return waits
+
+
+def test_grading_retries_429_and_honours_retry_after(sleeps):
+    cache = MemoryLRUCache()
+    with StubGemini(0.0, failures=[429, 503], retry_after=7) as gemini:
+        result = call_gemini_api_cached('An essay.', 'Rubric', api_key='k', api_base=gemini.base_url, cache=cache)
+        again = call_gemini_api_cached('An essay.', 'Rubric', api_key='k', api_base=gemini.base_url, cache=cache)
+    assert gemini.requests == 3
+    assert sleeps == [7, 7]
+    assert 50 <= result['grade'] < 100
+    assert again == result
+
+
+def test_grading_failure_after_retries_is_not_cached(sleeps):
+    cache = MemoryLRUCache()
+    with StubGemini(0.0, failures=[429] * 3) as gemini:
+        result = call_gemini_api_cached('An essay.', 'Rubric', api_key='k', api_base=gemini.base_url,
+                                        max_retries=1, cache=cache)
+        retried = call_gemini_api_cached('An essay.', 'Rubric', api_key='k', api_base=gemini.base_url,
+                                         max_retries=1, cache=cache)
+    assert gemini.requests == 4
+    assert result['feedback'].startswith('API call failed')
+    assert retried['feedback'] == 'Stub feedback.'
+
+
+def test_batch_grading_retries_429(sleeps):
+    items = [('a', 'First essay.'), ('b', 'Second essay.')]
+    with StubGemini(0.0, failures=[429]) as gemini:
+        results = call_gemini_batch(items, 'Rubric', api_key='k', api_base=gemini.base_url)
+    assert gemini.requests == 2
+    assert len(sleeps) == 1
+    assert set(results) == {'a', 'b'}
+
+
+def test_grading_retries_a_request_that_times_out(monkeypatch):
+    with StubGemini(1.0) as gemini:
+        # The stub answers quickly once the first attempt has been abandoned
+        monkeypatch.setattr(grading, 'time', SimpleNamespace(sleep=lambda _: setattr(gemini, 'latency', 0.0),
+                                                             monotonic=time.monotonic))
+        result = call_gemini_api_cached('An essay.', 'Rubric', api_key='k', api_base=gemini.base_url,
+                                        cache=MemoryLRUCache(), timeout=(1, 0.2))
+    assert gemini.requests == 2
+    assert result['feedback'] == 'Stub feedback.'
+
+
+def test_grading_raises_when_every_attempt_times_out(sleeps):
+    with StubGemini(1.0) as gemini:
+        with pytest.raises(requests.Timeout):
+            call_gemini_api_cached('An essay.', 'Rubric', api_key='k', api_base=gemini.base_url,
+                                   max_retries=1, cache=MemoryLRUCache(), timeout=(1, 0.2))
+    assert gemini.requests == 2
+    assert len(sleeps) == 1
@@ -0,0 +1,88 @@
+import random
+
+import pytest
+
+from app.utils.plagiarism import calculate_plagiarism_scores, update_plagiarism_scores
+from app.utils.text_analysis import compute_min_hash_signatures
+
+WORDS = [f"w{i}" for i in range(300)]
+
+
+def mutate(rng, text, rate):
+    return " ".join(word if rng.random() > rate else rng.choice(WORDS) for word in text.split())
+
+
+def signature(text):
+    return compute_min_hash_signatures([text])[0]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_update_matches_full_recompute(seed):
+    rng = random.Random(seed)
+    essays = [" ".join(rng.choice(WORDS) for _ in range(200)) for _ in range(8)]
+
+    def submission(rate):
+        return signature(mutate(rng, rng.choice(essays), rng.random() * rate))
+
+    signatures = {f"k{i}": submission(0.5) for i in range(40)}
+    for run in range(6):
+        matches = {}
+        scores = calculate_plagiarism_scores(signatures, signatures, matches=matches)
+        previous = {key: (scores[key], matches[key]) for key in signatures}
+
+        current = dict(signatures)
+        changed = rng.sample(sorted(current), 4)
+        for key in changed:
+            current[key] = submission(0.6)
+        for key in rng.sample(sorted(set(current) - set(changed)), 3):
+            del current[key]
+        for i in range(3):
+            current[f"n{run}_{i}"] = submission(0.5)
+        kept = {key: previous[key] for key in current if key in signatures and key not in changed}
+
+        patched_matches = {}
+        patched = update_plagiarism_scores(current, kept, matches=patched_matches)
+        expected = calculate_plagiarism_scores(current, current)
+        assert patched.keys() == expected.keys()
+        for key, score in expected.items():
+            assert patched[key] == pytest.approx(score, abs=1e-9), key
+        assert all(match is None or match in current for match in patched_matches.values())
+        signatures = current
+
+
+def test_update_rechecks_documents_whose_match_was_removed():
+    rng = random.Random(0)
+    essay = " ".join(rng.choice(WORDS) for _ in range(200))
+    signatures = {'a': signature(essay), 'b': signature(essay), 'c': signature(mutate(rng, essay, 0.3))}
+    matches = {}
+    scores = calculate_plagiarism_scores(signatures, signatures, matches=matches)
+    assert scores['a'] == 100 and matches['a'] == 'b'
+
+    del signatures['b']
+    previous = {key: (scores[key], matches[key]) for key in signatures}
+    patched = update_plagiarism_scores(signatures, previous)
+    assert patched == pytest.approx(calculate_plagiarism_scores(signatures, signatures))
+    assert patched['a'] < 100
+
+
+def test_corpus_keys_are_namespaced_by_assignment(tmp_path):
+    from app.utils.corpus import SignatureCorpus
+    from app.utils.plagiarism import add_to_corpus, score_against_corpus
+
+    rng = random.Random(0)
+    essay = " ".join(rng.choice(WORDS) for _ in range(200))
+    other = " ".join(rng.choice(WORDS) for _ in range(200))
+    corpus = SignatureCorpus(str(tmp_path))
+    # Same submission id and file name in two courses
+    add_to_corpus(corpus, {'s1_essay.pdf': signature(essay)}, ['s1_essay.pdf'], {'s1_essay.pdf': 's1'}, 'c1/w1')
+    add_to_corpus(corpus, {'s1_essay.pdf': signature(other)}, ['s1_essay.pdf'], {'s1_essay.pdf': 's1'}, 'c2/w1')
+    assert sorted(corpus.key_to_row) == ['c1/w1/s1_essay.pdf', 'c2/w1/s1_essay.pdf']
+
+    # A copy of c1's essay handed in as s1 of a third course is still found
+    scores = {'s1_essay.pdf': 0.0}
+    score_against_corpus({'s1_essay.pdf': signature(essay)}, corpus, scores, {'s1_essay.pdf': 's1'}, 'c3/w1')
+    assert scores['s1_essay.pdf'] == 100
+    # but not when it is c1's own assignment
+    scores = {'s1_essay.pdf': 0.0}
+    score_against_corpus({'s1_essay.pdf': signature(essay)}, corpus, scores, {'s1_essay.pdf': 's1'}, 'c1/w1')
+    assert scores['s1_essay.pdf'] == 0
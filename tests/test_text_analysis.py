@@ -0,0 +1,52 @@
+import random
+
+import numpy as np
+import pytest
+from datasketch import MinHash
+
+from app.utils.text_analysis import (compute_min_hash_for_text, compute_min_hash_signatures, get_shingle_hashes,
+                                     signatures_from_shingle_hashes, signatures_from_shingle_sets)
+
+
+def datasketch_signature(items, num_perm, hashfunc=None):
+    minhash = MinHash(num_perm=num_perm, hashfunc=hashfunc) if hashfunc else MinHash(num_perm=num_perm)
+    for item in items:
+        minhash.update(item)
+    return minhash.hashvalues
+
+
+def random_shingle_sets(seed, count=6):
+    rng = random.Random(seed)
+    words = [f"word{i}" for i in range(500)]
+    return [
+        {" ".join(rng.choice(words) for _ in range(5)) for _ in range(rng.randint(1, 3000))}
+        for _ in range(count)
+    ]
+
+
+@pytest.mark.parametrize('num_perm', [16, 128])
+@pytest.mark.parametrize('seed', range(3))
+def test_shingle_set_signatures_match_datasketch(seed, num_perm):
+    shingle_sets = random_shingle_sets(seed)
+    # A small chunk size splits the larger sets across several passes
+    signatures = signatures_from_shingle_sets(shingle_sets, num_perm=num_perm, chunk_size=257)
+    assert signatures.shape == (len(shingle_sets), num_perm)
+    for row, shingles in zip(signatures, shingle_sets):
+        expected = datasketch_signature((shingle.encode('utf8') for shingle in shingles), num_perm)
+        np.testing.assert_array_equal(row, expected)
+
+
+def test_empty_shingle_set_matches_empty_minhash():
+    signatures = signatures_from_shingle_sets([set()], num_perm=64)
+    np.testing.assert_array_equal(signatures[0], MinHash(num_perm=64).hashvalues)
+
+
+def test_shingle_hash_signatures_match_datasketch():
+    text = " ".join(random.Random(0).choice(["alpha", "beta", "gamma", "delta", "."]) for _ in range(400))
+    hashes = get_shingle_hashes(text)
+    signatures = signatures_from_shingle_hashes([hashes], chunk_size=100)
+    # datasketch applies the same permutations to any integer hash
+    expected = datasketch_signature((int(h) for h in hashes), 128, hashfunc=int)
+    np.testing.assert_array_equal(signatures[0], expected)
+    np.testing.assert_array_equal(compute_min_hash_signatures([text])[0], expected)
+    np.testing.assert_array_equal(compute_min_hash_for_text(text).hashvalues, expected)
@@ -0,0 +1,11 @@
+"""
+WSGI entry point for production servers (see gunicorn.conf.py).
+
+Heavy modules are imported and warmed here, so with preload_app they load once
+in the master and are shared copy-on-write by the forked workers.
+"""
+from app import create_app
+from app.utils.warmup import warm_up
+
+app = create_app()
+warm_up(app)